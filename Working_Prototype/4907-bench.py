@@ -0,0 +1,235 @@
+import os
+import sys
+import csv
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import importlib.util
+
+# benchmarks for the prototype, results go to <out>.json and <out>.csv so runs on different commits can be diffed
+# usage: python 4907-bench.py [--quick] [--out bench_<commit>]
+# needs EGL (Mesa's llvmpipe is fine) for the frame rate cases, the rest runs anywhere
+
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl") # must be set before the prototype imports PyOpenGL
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+here = os.path.dirname(os.path.abspath(__file__))
+os.chdir(here) # the logs name their .obj files relative to this folder
+spec = importlib.util.spec_from_file_location("prototype", os.path.join(here, "4907-prototype.py"))
+prototype = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(prototype)
+
+from PyQt6.QtWidgets import QApplication
+from OpenGL.GL import glFinish, glGetString, GL_RENDERER, glBindFramebuffer, GL_FRAMEBUFFER
+
+MESHES = ["bell_412.obj", "../cone.obj"]
+SHIPPED_LOGS = ["4907-1.log", "4907-loop.log"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else math.nan
+
+
+def synthetic_log(path, objects, lights, rate, duration, seed=4907):
+    """objects helicopters and cones on a grid, lights on the first one, and rate MODIFY lines a second
+    spread round robin over the objects, each moving along a small circle and turning."""
+    rng = random.Random(seed)
+    grid = math.ceil(math.sqrt(objects))
+    lines = []
+    homes = []
+    for i in range(objects):
+        x, z = (i % grid - grid / 2) * 3, -(i // grid) * 3
+        colour = [rng.randrange(256) for _ in range(3)]
+        homes.append((x, z, colour))
+        lines.append(f"CREATE,0.00,{MESHES[i % 2]},{x:.2f},2,{z:.2f},{colour[0]},{colour[1]},{colour[2]},0,0,0,0.6,object_{i + 1}")
+    lines.append(f"SET_CAMERA,0.00,1,25,0,0,-10,{-10 - grid * 2}")
+    for i in range(lights):
+        angle = 2 * math.pi * i / max(lights, 1)
+        lines.append(f"ADD_LIGHT,0.00,{math.cos(angle):.2f},0.5,{math.sin(angle):.2f},255,{rng.randrange(256)},0")
+    for k in range(int(rate * duration)):
+        t = (k + 1) / rate
+        i = k % objects
+        x, z, colour = homes[i]
+        lines.append(f"MODIFY,{t:.3f},{i + 1},{x + math.cos(t):.3f},2,{z + math.sin(t):.3f},"
+                     f"{colour[0]},{colour[1]},{colour[2]},0,{t * 30 % 360:.1f},0,0.6,object_{i + 1}")
+    with open(path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    return len(lines)
+
+
+class Results:
+    def __init__(self):
+        self.rows = [] # (case, metric, value, unit)
+
+    def add(self, case, metric, value, unit):
+        self.rows.append((case, metric, float(value), unit))
+        print(f"{case:<32} {metric:<28} {value:12.3f} {unit}")
+
+    def write(self, out, meta):
+        with open(out + ".json", "w") as file:
+            json.dump({"meta": meta, "results": [dict(zip(("case", "metric", "value", "unit"), row)) for row in self.rows]},
+                      file, indent=1)
+        with open(out + ".csv", "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(("case", "metric", "value", "unit"))
+            writer.writerows(self.rows)
+
+
+def bench_obj(results, repeats):
+    for path in MESHES:
+        case = "obj " + os.path.basename(path)
+        prototype.ObjLoader.use_cache = False
+        cold = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            mesh = prototype.ObjLoader(path)
+            cold.append(time.perf_counter() - start)
+        prototype.ObjLoader.use_cache = True
+        prototype.ObjLoader(path) # make sure the cache exists
+        warm = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            prototype.ObjLoader(path)
+            warm.append(time.perf_counter() - start)
+        results.add(case, "triangles", len(mesh.index_data), "count")
+        results.add(case, "parse_ms", 1000 * min(cold), "ms")
+        results.add(case, "cached_load_ms", 1000 * min(warm), "ms")
+
+
+def bench_parse(results, case, path):
+    with open(path, "rb") as file:
+        data = file.read()
+    lines = data.decode().splitlines()
+    start = time.perf_counter()
+    count = sum(prototype.parse_event(line) is not None for line in lines)
+    results.add(case, "parse_events_per_s", count / (time.perf_counter() - start), "events/s")
+    start = time.perf_counter()
+    prototype.compile_log(data)
+    results.add(case, "compile_events_per_s", count / (time.perf_counter() - start), "events/s")
+    prototype.LogFile(path) # write the cache if it is missing or stale
+    start = time.perf_counter()
+    prototype.LogFile(path)
+    results.add(case, "open_compiled_ms", 1000 * (time.perf_counter() - start), "ms")
+
+
+def bench_dispatch(results, app, case, path, seconds):
+    """Log time between an event's timestamp and the GUI thread taking it off the queue, at 1x with the usual
+    16ms drain. Timed before coalescing so the updates it drops count too, applying follows in the same call."""
+    reader = prototype.fileReader(path, None, None)
+    window = reader.ref
+    latencies = []
+    counts = {"received": 0, "applied": 0}
+    drain, apply_event = window.events.drain, window.apply_event
+    def timed_drain():
+        events = drain()
+        now = reader.clock.now()
+        latencies.extend(now - event[1] for event in events if event[0] not in ("WIPE", "PING")) # the rest carry their log time
+        counts["received"] += len(events)
+        return events
+    def counted(event):
+        counts["applied"] += 1
+        apply_event(event)
+    window.events.drain, window.apply_event = timed_drain, counted
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        app.processEvents()
+        time.sleep(0.002)
+    reader.clock.pause() # park the reader thread, looping logs would play forever
+    window.hide()
+    if latencies:
+        results.add(case, "dispatch_latency_p50_ms", 1000 * percentile(latencies, 50), "ms")
+        results.add(case, "dispatch_latency_p95_ms", 1000 * percentile(latencies, 95), "ms")
+        results.add(case, "dispatch_latency_max_ms", 1000 * max(latencies), "ms")
+    results.add(case, "reader_max_lag_ms", 1000 * reader.max_lag, "ms")
+    results.add(case, "events_received", counts["received"], "count")
+    results.add(case, "events_coalesced_away", counts["received"] - counts["applied"], "count")
+
+
+def bench_frames(results, case, path, frames, size, fps=30.0):
+    """Frame rate drawing the log's scene into an offscreen framebuffer, stepping playback by 1/fps a frame."""
+    width, height = size
+    reader = prototype.fileReader(path, None, None, headless=True)
+    window, widget = reader.ref, reader.ref.opengl_widget
+    widget.resize(width, height)
+    framebuffer = prototype.Framebuffer(width, height)
+    widget.initializeGL()
+    widget.resizeGL(width, height)
+    glBindFramebuffer(GL_FRAMEBUFFER, framebuffer.fbo)
+    for _ in range(5): # warm up, uploads the meshes
+        reader.step(1 / fps)
+        window.apply_events()
+        widget.paintGL()
+    glFinish()
+    times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        reader.step(1 / fps)
+        window.apply_events()
+        widget.paintGL()
+        glFinish() # llvmpipe draws asynchronously, count the rasterising too
+        times.append(time.perf_counter() - start)
+    results.add(case, "fps", len(times) / sum(times), "frames/s")
+    results.add(case, "frame_p95_ms", 1000 * percentile(times, 95), "ms")
+    summary = widget.profiler.summary()
+    for name in ("objects_ms", "translucent_ms", "labels_ms", "lights_ms", "light_cull_ms", "events_ms", "draw_calls"):
+        if name in summary:
+            results.add(case, name, summary[name]["mean"], "ms" if name.endswith("_ms") else "count")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=here).stdout.strip()
+    except OSError:
+        return ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the prototype's loading, playback and drawing")
+    parser.add_argument("--quick", action="store_true", help="smaller scenes and shorter runs")
+    parser.add_argument("--out", default=None, help="output path without extension, default bench_<commit>")
+    parser.add_argument("--no-gl", action="store_true", help="skip the frame rate cases")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    commit = git_commit()
+    out = args.out or f"bench_{commit or 'local'}"
+    meta = {"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "quick": args.quick}
+    if not args.no_gl:
+        try:
+            context = prototype.headless_context()
+            meta["renderer"] = glGetString(GL_RENDERER).decode()
+        except Exception as e: # no EGL here, still measure everything else
+            print("no headless GL, skipping frame rates:", e)
+            args.no_gl = True
+
+    # (objects, lights, MODIFY lines a second), seconds of log
+    scenes = [(6, 5, 50), (50, 10, 500)] if args.quick else [(6, 5, 50), (50, 10, 500), (200, 20, 2000)]
+    duration = 10 if args.quick else 30
+    frames = 60 if args.quick else 200
+    results = Results()
+    bench_obj(results, 3 if args.quick else 10)
+    with tempfile.TemporaryDirectory() as folder:
+        cases = []
+        for objects, lights, rate in scenes:
+            path = os.path.join(folder, f"synthetic_{objects}_{lights}_{rate}.log")
+            synthetic_log(path, objects, lights, rate, duration)
+            cases.append((f"synthetic {objects}obj {lights}lit {rate}/s", path))
+        cases += [(log, log) for log in SHIPPED_LOGS]
+        for case, path in cases:
+            bench_parse(results, case, path)
+        for case, path in cases:
+            bench_dispatch(results, app, case, path, 2 if args.quick else 5)
+        if not args.no_gl:
+            for case, path in cases:
+                bench_frames(results, case, path, frames, (640, 480))
+    results.write(out, meta)
+    print("wrote", out + ".json", "and", out + ".csv")
+    os._exit(0) # reader threads are parked, not finished
@@ -0,0 +1,82 @@
+import sys
+import time
+import asyncio
+import statistics
+
+# loopback test client for the prototype's socket input (option 4)
+# usage: python 4907-client.py <host:port or unix socket path> <file.log> [rate, 0 for as fast as possible] [producers]
+# sends the .log lines at their timestamps with a PING every ping_interval seconds and prints the
+# round trip of the PINGs, which come back once the GUI has applied everything sent before them
+
+ping_interval = 0.1
+
+
+async def connect(address):
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return await asyncio.open_connection(host or "127.0.0.1", int(port))
+    return await asyncio.open_unix_connection(address)
+
+
+async def produce(address, lines, rate, producer, latencies, created):
+    if producer > 0: # only send updates once the objects they refer to exist
+        await created.wait()
+    reader, writer = await connect(address)
+    sent = {} # token -> perf_counter when the PING went out
+    last_create = max((i for i, line in enumerate(lines) if line.startswith("CREATE")), default=-1)
+
+    async def pongs():
+        while line := await reader.readline():
+            token = line.decode().strip().split(",")[1]
+            latencies.append(time.perf_counter() - sent.pop(token))
+            if token == "created":
+                created.set()
+
+    receiver = asyncio.create_task(pongs())
+    start = last_ping = time.perf_counter()
+    for number, line in enumerate(lines):
+        if rate > 0:
+            delay = start + float(line.split(",")[1]) / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        writer.write(line.encode() + b"\n")
+        if number == last_create:
+            sent["created"] = time.perf_counter()
+            writer.write(b"PING,created\n")
+        elif time.perf_counter() - last_ping > ping_interval:
+            last_ping = time.perf_counter()
+            token = f"{producer}-{number}"
+            sent[token] = last_ping
+            writer.write(f"PING,{token}\n".encode())
+        await writer.drain() # waits while the viewer is applying backpressure
+    while sent: # wait for the outstanding PONGs
+        await asyncio.sleep(0.05)
+    receiver.cancel()
+    writer.close()
+
+
+async def main(address, path, rate, producers):
+    lines = [line for line in open(path).read().splitlines() if line.strip()]
+    latencies = []
+    created = asyncio.Event()
+    start = time.perf_counter()
+    # the first producer sends the whole log, the rest only send its updates so object indexes stay valid
+    updates = [line for line in lines if line.startswith("MODIFY")]
+    tasks = [produce(address, lines if i == 0 else updates, rate, i, latencies, created) for i in range(producers)]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    count = len(lines) + (producers - 1) * len(updates)
+    print(f"{count} events in {elapsed:.2f}s ({count / elapsed:.0f}/s) from {producers} producer(s)")
+    if latencies:
+        latencies.sort()
+        print(f"ping round trip over {len(latencies)} pings: mean {1000 * statistics.mean(latencies):.1f}ms "
+              f"p50 {1000 * latencies[len(latencies) // 2]:.1f}ms p99 {1000 * latencies[int(len(latencies) * 0.99)]:.1f}ms "
+              f"max {1000 * latencies[-1]:.1f}ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python 4907-client.py <host:port or socket path> <file.log> [rate] [producers]")
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 1.0,
+                     int(sys.argv[4]) if len(sys.argv) > 4 else 1))
@@ -1,5 +1,9 @@
 import sys
 import os
+if "--render" in sys.argv: # headless, pick the platforms before Qt and PyOpenGL load theirs
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+    os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
 import matplotlib
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
@@ -11,55 +15,1186 @@ from PyQt6.QtOpenGLWidgets import QOpenGLWidget
 from PyQt6.QtCore import QPoint
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from PyQt6.QtCore import Qt, QMimeData
+from OpenGL.raw.GL.VERSION import GL_3_3
+from PyQt6.QtCore import Qt, QMimeData, QTimer
 from PyQt6.QtGui import QKeyEvent,  QDrag, QPainter, QColor, QPixmap
 import math
+import re
+import json
+import hashlib
+import itertools
+import heapq
+import collections
+import contextlib
+import csv
+import asyncio
+import bisect
+import ctypes
+import concurrent.futures
+import multiprocessing
 import numpy as np
 import threading
 from PIL import Image, ImageDraw, ImageFont
 import time
 
+def fan_triangulate(indices, counts):
+    """Split polygons stored back to back in indices (counts[i] corners each) into (M,3) triangles fanned from each first corner."""
+    starts = np.cumsum(counts) - counts
+    triangles = np.maximum(counts - 2, 0)
+    first = np.repeat(starts, triangles)
+    step = np.arange(triangles.sum()) - np.repeat(np.cumsum(triangles) - triangles, triangles) + 1
+    return np.stack((indices[first], indices[first + step], indices[first + step + 1]), axis=1)
+
+def parse_obj_chunk(data):
+    """Parse the v and f records of whole OBJ lines (bytes) into (N,3) float32 vertices and (M,3) int64 triangles.
+    Positive references are made 0-based. Negative ones can only be resolved against vertices seen in this chunk, so they
+    are returned relative to its first vertex and flagged in the third result, a (M,3) bool array."""
+    lines = data.split(b"\n")
+    vertex_lines = [line[2:] for line in lines if line.startswith(b"v ")]
+    face_tokens = [line[2:].split() for line in lines if line.startswith(b"f ")]
+
+    vertices = np.fromstring(b" ".join(vertex_lines).decode(), dtype=np.float32, sep=" ")
+    if len(vertices) != 3 * len(vertex_lines): # some vertices carry w or colour values, keep only x y z
+        vertices = np.array([line.split()[:3] for line in vertex_lines]).astype(np.float32)
+    vertices = vertices.reshape(-1, 3)
+
+    counts = np.fromiter(map(len, face_tokens), dtype=np.int64, count=len(face_tokens))
+    corners = re.sub(rb"/\S*", b"", b" ".join(itertools.chain.from_iterable(face_tokens))) # v/vt/vn -> v
+    indices = np.fromstring(corners.decode(), dtype=np.int64, sep=" ")
+    relative = indices < 0
+    if relative.any(): # negative indices count back from the last vertex defined before the face
+        defined, before = 0, []
+        for line in lines:
+            if line.startswith(b"v "):
+                defined += 1
+            elif line.startswith(b"f "):
+                before.append(defined)
+        indices = np.where(relative, np.repeat(before, counts) + indices, indices - 1)
+    else:
+        indices -= 1
+    return vertices, fan_triangulate(indices, counts), fan_triangulate(relative, counts)
+
+def parse_obj(data):
+    """Parse OBJ file contents (bytes) into (N,3) float32 vertices and (M,3) uint32 triangles."""
+    vertices, triangles, relative = parse_obj_chunk(data) # relative to the first vertex of the file, nothing to add
+    return vertices, triangles.astype(np.uint32)
+
+def parse_obj_range(job):
+    filename, start, end = job
+    with open(filename, "rb") as file:
+        file.seek(start)
+        return parse_obj_chunk(file.read(end - start))
+
+def parse_obj_parallel(filename, workers):
+    """parse_obj over a process pool: the file is cut into one byte range per worker on line boundaries and the
+    chunks are joined back in order, offsetting each chunk's relative references by the vertices before it."""
+    size = os.path.getsize(filename)
+    cuts = [0]
+    with open(filename, "rb") as file:
+        for i in range(1, workers):
+            file.seek(max(size * i // workers, cuts[-1]))
+            file.readline() # finish the line we landed in, it belongs to the previous chunk
+            cuts.append(min(file.tell(), size))
+    cuts.append(size)
+    jobs = [(filename, start, end) for start, end in zip(cuts, cuts[1:]) if end > start]
+    # never fork: this runs on the file reader thread of a process that already has Qt, asyncio and other threads
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    with concurrent.futures.ProcessPoolExecutor(len(jobs), mp_context=context) as pool:
+        chunks = list(pool.map(parse_obj_range, jobs))
+    base = 0
+    for vertices, triangles, relative in chunks:
+        triangles[relative] += base
+        base += len(vertices)
+    vertices = np.concatenate([chunk[0] for chunk in chunks]) if chunks else np.zeros((0, 3), dtype=np.float32)
+    triangles = np.concatenate([chunk[1] for chunk in chunks]) if chunks else np.zeros((0, 3), dtype=np.int64)
+    return vertices, triangles.astype(np.uint32)
+
+
+ARRAY_FILE_MAGIC = b"4907ARR1"
+
+def aligned(offset, alignment=64):
+    return -(-offset // alignment) * alignment
+
+def write_array_file(path, header, arrays):
+    """Write arrays to one binary file: magic, JSON header, then each array's raw bytes 64-byte aligned so it can be memory-mapped."""
+    layout, offset = {}, 0
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, list(array.shape), offset]
+        offset = aligned(offset + array.nbytes)
+    text = json.dumps(dict(header, arrays=layout)).encode()
+    start = aligned(len(ARRAY_FILE_MAGIC) + 8 + len(text))
+    temp = path + ".tmp"
+    with open(temp, "wb") as file: # written aside and swapped in so a reader never maps a half written file
+        file.write(ARRAY_FILE_MAGIC + len(text).to_bytes(8, "little") + text)
+        for name, array in arrays.items():
+            file.seek(start + layout[name][2])
+            file.write(array.tobytes())
+        file.truncate(start + offset)
+    os.replace(temp, path)
+
+def read_array_file(path):
+    """Returns the header and a read-only memory map of each array written by write_array_file."""
+    with open(path, "rb") as file:
+        if file.read(len(ARRAY_FILE_MAGIC)) != ARRAY_FILE_MAGIC:
+            raise ValueError(path + " is not an array file")
+        length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(length))
+    start = aligned(len(ARRAY_FILE_MAGIC) + 8 + length)
+    arrays = {}
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        if 0 in shape: # nothing to map
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=start + offset, shape=tuple(shape))
+    return header, arrays
+
+def rewrite_array_header(path, header):
+    """Replace the JSON header of an array file in place, False if it would no longer end before the arrays start."""
+    text = json.dumps(header).encode()
+    with open(path, "r+b") as file:
+        file.seek(len(ARRAY_FILE_MAGIC))
+        length = int.from_bytes(file.read(8), "little")
+        text = text.ljust(length) # trailing spaces are still valid JSON
+        if aligned(len(ARRAY_FILE_MAGIC) + 8 + len(text)) != aligned(len(ARRAY_FILE_MAGIC) + 8 + length):
+            return False
+        file.seek(len(ARRAY_FILE_MAGIC))
+        file.write(len(text).to_bytes(8, "little") + text)
+    return True
+
+def sidecar_matches(header, source, stat, version, cache=None):
+    """Whether a cache header was written by this version of the code for this exact source file. If only the
+    mtime changed and the contents hash the same, the cache's header gets the new mtime so the next load skips the hash."""
+    if header.get("version") != version or header.get("size") != stat.st_size:
+        return False
+    if header.get("mtime") != stat.st_mtime_ns: # touched or copied, still good if the contents are the same
+        with open(source, "rb") as file:
+            if hashlib.blake2b(file.read()).hexdigest() != header.get("hash"):
+                return False
+        if cache is not None:
+            try:
+                rewrite_array_header(cache, dict(header, mtime=stat.st_mtime_ns))
+            except OSError: # read only folder, hash again next time
+                pass
+    return True
+
+
+class KDTree:
+    """Balanced k-d tree over an (N,D) point array answering nearest and k-nearest queries."""
+    leaf_size = 16 # ranges this small are searched by brute force
+
+    def __init__(self, points):
+        self.order = np.arange(len(points)) # point indices, arranged so every range below is one subtree
+        self.axis = np.zeros(len(points), dtype=np.int8) # split axis of the subtree whose median sits at this slot
+        points = np.asarray(points, dtype=np.float64)
+        ranges = [(0, len(points))]
+        while ranges:
+            start, end = ranges.pop()
+            if end - start <= self.leaf_size:
+                continue
+            idx = self.order[start:end]
+            span = points[idx]
+            axis = int(np.argmax(span.max(axis=0) - span.min(axis=0))) # split the widest axis
+            mid = (end - start) // 2
+            self.order[start:end] = idx[np.argpartition(span[:, axis], mid)]
+            self.axis[start + mid] = axis
+            ranges += [(start, start + mid), (start + mid + 1, end)]
+        self.points = points[self.order]
+
+    def query(self, point, k=1):
+        """Returns the distances and indices (into the original array) of the k closest points, nearest first."""
+        best = [] # max heap of (-squared distance, slot) holding the k best so far
+        self.search(0, len(self.points), np.asarray(point, dtype=np.float64), k, best)
+        best.sort(reverse=True)
+        return [math.sqrt(-d) for d, slot in best], [int(self.order[slot]) for d, slot in best]
+
+    def search(self, start, end, point, k, best):
+        if end - start <= self.leaf_size:
+            distances = ((self.points[start:end] - point) ** 2).sum(axis=1)
+            for slot in np.argsort(distances)[:k]:
+                self.offer(float(distances[slot]), start + int(slot), k, best)
+            return
+        mid = start + (end - start) // 2
+        axis = self.axis[mid]
+        offset = point[axis] - self.points[mid, axis]
+        self.offer(float(((self.points[mid] - point) ** 2).sum()), mid, k, best)
+        near, far = ((start, mid), (mid + 1, end)) if offset < 0 else ((mid + 1, end), (start, mid))
+        self.search(*near, point, k, best)
+        if len(best) < k or offset * offset < -best[0][0]: # the splitting plane is closer than the worst match
+            self.search(*far, point, k, best)
+
+    def offer(self, distance, slot, k, best):
+        if len(best) < k:
+            heapq.heappush(best, (-distance, slot))
+        elif distance < -best[0][0]:
+            heapq.heapreplace(best, (-distance, slot))
+
+
+def cluster_vertices(vertices, triangles, cells):
+    """Simplify a mesh by vertex clustering: snap the vertices to a grid with cells cells along the longest
+    side of the bounding box, merge each cell's vertices into their mean and drop the triangles that collapse."""
+    if len(vertices) == 0 or len(triangles) == 0:
+        return vertices, triangles
+    low = vertices.min(axis=0)
+    size = float((vertices.max(axis=0) - low).max()) / cells
+    if size == 0:
+        return vertices, triangles
+    keys = np.minimum(((vertices - low) / size).astype(np.int64), cells) # the far corner lands on the boundary
+    cell, remap = np.unique((keys[:, 0] * (cells + 1) + keys[:, 1]) * (cells + 1) + keys[:, 2], return_inverse=True)
+    remap = remap.reshape(-1)
+    counts = np.bincount(remap)
+    merged = np.stack([np.bincount(remap, weights=vertices[:, a]) for a in range(3)], axis=1) / counts[:, None]
+    merged_triangles = remap[triangles]
+    a, b, c = merged_triangles.T
+    merged_triangles = merged_triangles[(a != b) & (b != c) & (a != c)]
+    # the same triangle can come out of several cells, keep its first copy and winding
+    _, first = np.unique(np.sort(merged_triangles, axis=1), axis=0, return_index=True)
+    return merged.astype(np.float32), merged_triangles[np.sort(first)].astype(np.uint32)
+
+
+def vertex_normals(vertices, triangles):
+    """Per-vertex normals, the area weighted mean of the normals of the triangles around each vertex."""
+    corners = vertices.astype(np.float64)[triangles]
+    faces = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]) # twice the area long
+    normals = np.stack([np.bincount(triangles.ravel(), weights=np.repeat(faces[:, a], 3), minlength=len(vertices))
+                        for a in range(3)], axis=1)
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    return (normals / np.where(length > 0, length, 1)).astype(np.float32)
+
+
+MESH_CACHE_VERSION = 4
+
 class ObjLoader:
+    use_cache = True # keep a binary copy of each parsed .obj beside it (<file>.obj.cache)
+    parallel_workers = 0 # above 1, files of at least parallel_min_size bytes are parsed across that many processes
+    parallel_min_size = 32 * 1024 * 1024
+    lod_cells = (32, 16, 8) # grid cells along the longest side for each simplified level, finest first
+
     def __init__(self, filename):
-        self.vertices = []
-        self.faces = []
+        self.path = filename
+        self.vertex_data = np.zeros((0, 3), dtype=np.float32) # (N,3) x y z
+        self.index_data = np.zeros((0, 3), dtype=np.uint32) # (M,3) triangles, every face is triangulated at load
+        self.normal_data = np.zeros((0, 3), dtype=np.float32) # (N,3) unit normal of each vertex, for lighting
         self.center = (0.0, 0.0, 0.0)
+        self.bounds = np.zeros((2, 3)) # axis aligned bounding box, min corner then max corner
+        self.sphere = np.zeros(4) # bounding sphere x y z radius, centred on the box
+        self.lods = [] # (vertices, triangles, normals) of each simplified level, level 0 is the mesh itself
+        self.buffers = {} # level -> GPU copy of that level, uploaded on first draw
+        self.trees = {} # axes -> KDTree of the vertices projected on those axes, built on first use
         self.load_obj(filename)
 
+    @property
+    def vertices(self):
+        return self.vertex_data
+
+    @property
+    def faces(self):
+        return self.index_data
+
     def load_obj(self, filename):
-        with open(filename, "r") as file:
-            for line in file:
-                if line.startswith("v "):  
-                    parts = line.split()
-                    vertex = (float(parts[1]), float(parts[2]), float(parts[3]))
-                    self.vertices.append(vertex)
-                elif line.startswith("f "):  
-                    parts = line.split()
-                    face = [int(idx.split('/')[0]) - 1 for idx in parts[1:]]
-                    self.faces.append(face)
+        cache = filename + ".cache"
+        stat = os.stat(filename)
+        if self.use_cache and self.load_cache(cache, filename, stat):
+            return
+        if self.parallel_workers > 1 and stat.st_size >= self.parallel_min_size:
+            self.vertex_data, self.index_data = parse_obj_parallel(filename, self.parallel_workers)
+            data = None
+        else:
+            with open(filename, "rb") as file:
+                data = file.read()
+            self.vertex_data, self.index_data = parse_obj(data)
         self.calculate_center()
+        self.calculate_bounds()
+        self.calculate_sphere()
+        self.normal_data = vertex_normals(self.vertex_data, self.index_data)
+        self.calculate_lods()
+        if self.use_cache:
+            if data is None:
+                with open(filename, "rb") as file:
+                    data = file.read()
+            self.save_cache(cache, stat, hashlib.blake2b(data).hexdigest())
+
+    def load_cache(self, cache, filename, stat):
+        """Map the arrays from the sidecar instead of parsing, if it was written for this exact file."""
+        try:
+            header, arrays = read_array_file(cache)
+        except (OSError, ValueError, KeyError):
+            return False
+        if not sidecar_matches(header, filename, stat, MESH_CACHE_VERSION, cache) or header["lod_cells"] != list(self.lod_cells):
+            return False
+        self.vertex_data = arrays["vertices"]
+        self.index_data = arrays["triangles"]
+        self.normal_data = arrays["normals"]
+        self.center = tuple(header["center"])
+        self.bounds = np.array(header["bounds"])
+        self.sphere = np.array(header["sphere"])
+        self.lods = [tuple(arrays[f"lod{level}_{name}"] for name in ("vertices", "triangles", "normals"))
+                     for level in range(1, len(self.lod_cells) + 1)]
+        return True
+
+    def save_cache(self, cache, stat, digest):
+        header = {"version": MESH_CACHE_VERSION, "size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest,
+                  "center": list(self.center), "bounds": self.bounds.tolist(), "sphere": self.sphere.tolist(), "lod_cells": list(self.lod_cells)}
+        arrays = {"vertices": self.vertex_data, "triangles": self.index_data, "normals": self.normal_data}
+        for level, lod in enumerate(self.lods, 1):
+            for name, array in zip(("vertices", "triangles", "normals"), lod):
+                arrays[f"lod{level}_{name}"] = array
+        try:
+            write_array_file(cache, header, arrays)
+        except OSError as e: # read only folder or the old cache is still mapped, just parse again next time
+            print("could not write mesh cache", cache, e)
         
-    def find_closest_vertex(self, x, y, z):
+    def spatial_index(self, axes=(0, 1, 2)):
+        if axes not in self.trees:
+            self.trees[axes] = KDTree(self.vertex_data[:, list(axes)])
+        return self.trees[axes]
+
+    def find_closest_vertices(self, x, y, z, k, axes=(0, 1, 2)):
+        """The k vertices closest to a point, nearest first. axes limits the match to those coordinates, e.g. (0, 2) for a top view."""
+        if len(self.vertex_data) == 0:
+            return []
+        point = (x, y, z)
+        distances, indices = self.spatial_index(tuple(axes)).query([point[a] for a in axes], k)
+        return [tuple(float(c) for c in self.vertex_data[i]) for i in indices]
+
+    def find_closest_vertex(self, x, y, z, axes=(0, 1, 2)):
         """Find the closest vertex to a given point."""
-        min_distance = float('inf')
-        closest_vertex = None
-
-        for vertex in self.vertices:
-            distance = np.sqrt((vertex[0] - x) ** 2 + (vertex[1] - y) ** 2 + (vertex[2] - z) ** 2)
-            if distance < min_distance:
-                min_distance = distance
-                closest_vertex = vertex
-
-        return closest_vertex
+        closest = self.find_closest_vertices(x, y, z, 1, axes)
+        return closest[0] if closest else None
     
                     
     def calculate_center(self):
-        if not self.vertices:
+        if len(self.vertex_data) == 0:
             return
-        xs, ys, zs = zip(*self.vertices)
-        self.center = (sum(xs) / len(xs), sum(ys) / len(ys), sum(zs) / len(zs))
-        
+        self.center = tuple(float(c) for c in self.vertex_data.mean(axis=0, dtype=np.float64))
+
+    def calculate_bounds(self):
+        if len(self.vertex_data) == 0:
+            return
+        self.bounds = np.array([self.vertex_data.min(axis=0), self.vertex_data.max(axis=0)], dtype=np.float64)
 
+    def calculate_sphere(self):
+        if len(self.vertex_data) == 0:
+            return
+        middle = self.bounds.mean(axis=0)
+        self.sphere = np.append(middle, np.linalg.norm(self.vertex_data - middle, axis=1).max())
+
+    def calculate_lods(self):
+        self.lods = []
+        for cells in self.lod_cells:
+            vertices, triangles = cluster_vertices(self.vertex_data, self.index_data, cells)
+            self.lods.append((vertices, triangles, vertex_normals(vertices, triangles)))
+
+    def level_buffer(self, level):
+        """GPU buffer of the mesh (level 0) or one of its simplified levels, uploaded on first use."""
+        if level not in self.buffers:
+            self.buffers[level] = MeshBuffer(*((self.vertex_data, self.index_data, self.normal_data) if level == 0 else self.lods[level - 1]))
+        return self.buffers[level]
+
+
+class MeshBuffer:
+    """Vertex, normal and index buffer objects for one level of an ObjLoader, drawn with a single glDrawElements."""
+    def __init__(self, vertices, triangles, normals=None):
+        self.vbo, self.ibo = glGenBuffers(2)
+        self.nbo = None
+        self.count = triangles.size
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        if normals is not None:
+            self.nbo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.nbo)
+            glBufferData(GL_ARRAY_BUFFER, normals.nbytes, normals, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, triangles.nbytes, triangles, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glDrawElements(GL_TRIANGLES, self.count, GL_UNSIGNED_INT, None)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        glDeleteBuffers(2, [self.vbo, self.ibo])
+        if self.nbo is not None:
+            glDeleteBuffers(1, [self.nbo])
+
+
+def sphere_mesh(radius, slices, stacks):
+    """Vertices and triangles of a UV sphere around the z axis, the same tessellation gluSphere makes."""
+    polar = np.linspace(0, np.pi, stacks + 1)[:, None]
+    azimuth = np.linspace(0, 2 * np.pi, slices, endpoint=False)[None, :]
+    vertices = radius * np.stack((np.sin(polar) * np.cos(azimuth), np.sin(polar) * np.sin(azimuth),
+                                  np.cos(polar) * np.ones_like(azimuth)), axis=-1).reshape(-1, 3)
+    stack, slice_ = np.meshgrid(np.arange(stacks), np.arange(slices), indexing="ij")
+    a = stack * slices + slice_
+    b, c, d = a + slices, (stack + 1) * slices + (slice_ + 1) % slices, stack * slices + (slice_ + 1) % slices
+    triangles = np.concatenate((np.stack((a, b, c), axis=-1)[:-1].reshape(-1, 3), # the last stack's b and c are both the pole
+                                np.stack((a, c, d), axis=-1)[1:].reshape(-1, 3))) # and the first stack's a and d
+    return vertices.astype(np.float32), triangles.astype(np.uint32)
+
+
+def translation(x, y, z):
+    m = np.identity(4)
+    m[:3, 3] = (x, y, z)
+    return m
+
+def rotation(angle, axis):
+    """Same matrix as glRotatef(angle, *axis) for a unit axis."""
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    x, y, z = axis
+    return np.array([[x*x*(1-c)+c,   x*y*(1-c)-z*s, x*z*(1-c)+y*s, 0],
+                     [y*x*(1-c)+z*s, y*y*(1-c)+c,   y*z*(1-c)-x*s, 0],
+                     [x*z*(1-c)-y*s, y*z*(1-c)+x*s, z*z*(1-c)+c,   0],
+                     [0,             0,             0,             1]])
+
+def perspective(fovy, aspect, near, far):
+    """Same matrix as gluPerspective."""
+    f = 1 / math.tan(math.radians(fovy) / 2)
+    return np.array([[f / aspect, 0, 0,                           0],
+                     [0,          f, 0,                           0],
+                     [0,          0, (far + near) / (near - far), 2 * far * near / (near - far)],
+                     [0,          0, -1,                          0]])
+
+def model_matrix(attributes):
+    """Object transform from obj_attributes: translate, then rotate about x, y and z like draw_obj did."""
+    position, angles = attributes[0], attributes[2]
+    return (translation(*position) @ rotation(angles[0], (1, 0, 0))
+            @ rotation(angles[1], (0, 1, 0)) @ rotation(angles[2], (0, 0, 1)))
+
+def instance_row(attributes):
+    """Per-instance attributes: the model matrix in column-major order followed by rgba."""
+    colour = attributes[1]
+    return np.concatenate((model_matrix(attributes).T.ravel(),
+                           (colour[0] / 255, colour[1] / 255, colour[2] / 255, attributes[3])))
+
+def quaternion_multiply(a, b):
+    """Hamilton products of rows of (w, x, y, z)."""
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack((aw*bw - ax*bx - ay*by - az*bz,
+                     aw*bx + ax*bw + ay*bz - az*by,
+                     aw*by - ax*bz + ay*bw + az*bx,
+                     aw*bz + ax*by - ay*bx + az*bw), axis=-1)
+
+def euler_quaternions(angles):
+    """Unit quaternions for rows of (angle_x, angle_y, angle_z) in degrees, the same rotation as model_matrix."""
+    half = np.radians(angles) / 2
+    c, s = np.cos(half), np.sin(half)
+    zero = np.zeros(len(half))
+    qx = np.stack((c[:, 0], s[:, 0], zero, zero), axis=-1)
+    qy = np.stack((c[:, 1], zero, s[:, 1], zero), axis=-1)
+    qz = np.stack((c[:, 2], zero, zero, s[:, 2]), axis=-1)
+    return quaternion_multiply(quaternion_multiply(qx, qy), qz)
+
+def slerp(q0, q1, t):
+    """Spherical interpolation between rows of unit quaternions, along the shorter arc."""
+    dot = np.sum(q0 * q1, axis=-1)
+    q1 = np.where(dot[:, None] < 0, -q1, q1)
+    theta = np.arccos(np.clip(np.abs(dot), 0, 1))
+    sin = np.sin(theta)
+    near = sin < 1e-6 # nearly the same rotation, lerp is exact enough and does not divide by zero
+    sin = np.where(near, 1, sin)
+    w0 = np.where(near, 1 - t, np.sin((1 - t) * theta) / sin)
+    w1 = np.where(near, t, np.sin(t * theta) / sin)
+    q = w0[:, None] * q0 + w1[:, None] * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+def quaternion_matrices(q):
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    return np.stack((np.stack((1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y)), axis=-1),
+                     np.stack((2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x)), axis=-1),
+                     np.stack((2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y)), axis=-1)), axis=-2)
+
+def interpolated_rows(t, motions):
+    """Instance rows (as instance_row) at log time t for objects moving between two samples, motions being
+    (t0, attributes0, t1, attributes1). Position, colour and transparency are blended linearly, rotation by slerp."""
+    t0 = np.array([m[0] for m in motions])
+    t1 = np.array([m[2] for m in motions])
+    start = np.array([[*m[1][0], *m[1][1], m[1][3]] for m in motions], dtype=float)
+    end = np.array([[*m[3][0], *m[3][1], m[3][3]] for m in motions], dtype=float)
+    alpha = np.clip((t - t0) / np.maximum(t1 - t0, 1e-9), 0, 1)
+    blend = start + (end - start) * alpha[:, None] # x y z r g b transparency
+    q = slerp(euler_quaternions(np.array([m[1][2] for m in motions], dtype=float)),
+              euler_quaternions(np.array([m[3][2] for m in motions], dtype=float)), alpha)
+    model = np.zeros((len(motions), 4, 4))
+    model[:, :3, :3] = quaternion_matrices(q)
+    model[:, :3, 3] = blend[:, :3]
+    model[:, 3, 3] = 1
+    return np.concatenate((model.transpose(0, 2, 1).reshape(-1, 16), blend[:, 3:6] / 255, blend[:, 6:]), axis=1)
+
+def frustum_planes(matrix):
+    """The six planes (a, b, c, d), normals pointing inwards and normalised, of the frustum of a projection @ view
+    matrix. A point p is inside when a*x + b*y + c*z + d >= 0 for every plane."""
+    planes = np.array([matrix[3] + matrix[0], matrix[3] - matrix[0], # left, right
+                       matrix[3] + matrix[1], matrix[3] - matrix[1], # bottom, top
+                       matrix[3] + matrix[2], matrix[3] - matrix[2]]) # near, far
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+def tile_lights(positions, ranges, view, projection, viewport, tile_size):
+    """Which lights can reach each tile_size square of the screen, from the screen rectangle of the box around
+    each light's sphere of influence. Returns an (tiles_y, tiles_x) array of [first, count] into a list of light
+    indexes, sorted by tile, and that list. Tiles count up from the bottom left like gl_FragCoord."""
+    width, height = viewport[2], viewport[3]
+    tiles_x, tiles_y = -(-width // tile_size), -(-height // tile_size)
+    near = projection[2, 3] / (projection[2, 2] - 1)
+    eye = positions @ view[:3, :3].T + view[:3, 3]
+    depth = -eye[:, 2]
+    lights = np.flatnonzero(depth + ranges > near) # some of the sphere is in front of the camera
+    eye, depth, ranges = eye[lights], depth[lights], ranges[lights]
+    straddles = depth - ranges <= near # crosses the near plane, could cover any part of the screen
+    closest = np.maximum(depth - ranges, near)[:, None]
+    farthest = (depth + ranges)[:, None]
+    rect = np.zeros((len(lights), 4)) # x0 y0 x1 y1 in pixels
+    for axis, scale, size in ((0, projection[0, 0], width), (1, projection[1, 1], height)):
+        # x / -z is monotonic over the box, so its extremes are at the corners
+        corners = scale * np.concatenate((((eye[:, axis] - ranges)[:, None] / np.hstack((closest, farthest))),
+                                          ((eye[:, axis] + ranges)[:, None] / np.hstack((closest, farthest)))), axis=1)
+        rect[:, axis] = np.where(straddles, -1, corners.min(axis=1)) * size / 2 + size / 2
+        rect[:, axis + 2] = np.where(straddles, 1, corners.max(axis=1)) * size / 2 + size / 2
+    on_screen = (rect[:, 2] >= 0) & (rect[:, 0] < width) & (rect[:, 3] >= 0) & (rect[:, 1] < height)
+    lights, rect = lights[on_screen], rect[on_screen]
+    x0, x1 = (np.clip(rect[:, [0, 2]] // tile_size, 0, tiles_x - 1).astype(np.int64)).T
+    y0, y1 = (np.clip(rect[:, [1, 3]] // tile_size, 0, tiles_y - 1).astype(np.int64)).T
+    across, count = x1 - x0 + 1, (x1 - x0 + 1) * (y1 - y0 + 1)
+    owner = np.repeat(np.arange(len(lights)), count) # one entry per (light, tile) pair
+    step = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    tile = (y0[owner] + step // across[owner]) * tiles_x + x0[owner] + step % across[owner]
+    order = np.argsort(tile.astype(np.uint16) if tiles_x * tiles_y <= 65536 else tile, kind="stable") # radix sort when it fits
+    per_tile = np.bincount(tile, minlength=tiles_x * tiles_y)
+    grid = np.stack((np.cumsum(per_tile) - per_tile, per_tile), axis=1).reshape(tiles_y, tiles_x, 2)
+    return grid, lights[owner[order]]
+
+INSTANCE_FLOATS = 20
+INSTANCE_ATTRIBUTES = {"position": 0, "model0": 1, "model1": 2, "model2": 3, "model3": 4, "colour": 5, "normal": 6}
+
+INSTANCE_VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec4 model0;
+attribute vec4 model1;
+attribute vec4 model2;
+attribute vec4 model3;
+attribute vec4 colour;
+varying vec4 v_colour;
+void main() {
+    mat4 model = mat4(model0, model1, model2, model3);
+    gl_Position = gl_ModelViewProjectionMatrix * model * vec4(position, 1.0);
+    v_colour = colour;
+}
+"""
+
+INSTANCE_FRAGMENT_SHADER = """
+#version 120
+varying vec4 v_colour;
+void main() {
+    gl_FragColor = v_colour;
+}
+"""
+
+MAX_TILE_LIGHTS = 64 # lights a fragment adds up at most, past this the farther ones in its tile's list are skipped
+
+LIT_VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec4 model0;
+attribute vec4 model1;
+attribute vec4 model2;
+attribute vec4 model3;
+attribute vec4 colour;
+attribute vec3 normal;
+varying vec4 v_colour;
+varying vec3 v_world;
+varying vec3 v_normal;
+void main() {
+    mat4 model = mat4(model0, model1, model2, model3);
+    vec4 world = model * vec4(position, 1.0);
+    gl_Position = gl_ModelViewProjectionMatrix * world;
+    v_world = world.xyz;
+    v_normal = mat3(model) * normal;
+    v_colour = colour;
+}
+"""
+
+LIT_FRAGMENT_SHADER = """
+#version 120
+uniform sampler2D lights; // one texel column per light: position and range, then colour
+uniform sampler2D tiles; // first index and count of each screen tile's lights
+uniform sampler2D light_indexes; // the tiles' light lists one after another, index_width to a row
+uniform float light_count;
+uniform vec2 tile_count;
+uniform float tile_size;
+uniform vec2 index_size;
+uniform float ambient;
+varying vec4 v_colour;
+varying vec3 v_world;
+varying vec3 v_normal;
+void main() {
+    vec3 n = normalize(v_normal);
+    if (!gl_FrontFacing)
+        n = -n; // the meshes are drawn two sided
+    vec3 light = vec3(ambient + (1.0 - ambient) * (0.5 + 0.5 * n.y)); // dim sky from above so the shape reads unlit
+    vec4 tile = texture2D(tiles, (floor(gl_FragCoord.xy / tile_size) + 0.5) / tile_count);
+    for (int i = 0; i < %d; i++) {
+        if (float(i) >= tile.y)
+            break;
+        float k = tile.x + float(i);
+        float index = texture2D(light_indexes, (vec2(mod(k, index_size.x), floor(k / index_size.x)) + 0.5) / index_size).r;
+        vec4 source = texture2D(lights, vec2((index + 0.5) / light_count, 0.25));
+        vec3 colour = texture2D(lights, vec2((index + 0.5) / light_count, 0.75)).rgb;
+        vec3 to_light = source.xyz - v_world;
+        float distance = length(to_light);
+        float falloff = clamp(1.0 - distance / source.w, 0.0, 1.0);
+        light += colour * falloff * falloff * max(dot(n, to_light / max(distance, 0.0001)), 0.0);
+    }
+    gl_FragColor = vec4(v_colour.rgb * light, v_colour.a);
+}
+""" % MAX_TILE_LIGHTS
+
+def build_program(vertex_source, fragment_source, attributes):
+    """Compile and link a shader program, returns None if the driver can't (callers fall back to fixed function)."""
+    try:
+        program = glCreateProgram()
+        for kind, source in ((GL_VERTEX_SHADER, vertex_source), (GL_FRAGMENT_SHADER, fragment_source)):
+            shader = glCreateShader(kind)
+            glShaderSource(shader, source)
+            glCompileShader(shader)
+            if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+                print("shader compile failed:", glGetShaderInfoLog(shader))
+                return None
+            glAttachShader(program, shader)
+            glDeleteShader(shader)
+        for name, location in attributes.items():
+            glBindAttribLocation(program, location, name)
+        glLinkProgram(program)
+        if not glGetProgramiv(program, GL_LINK_STATUS):
+            print("shader link failed:", glGetProgramInfoLog(program))
+            return None
+        return program
+    except Exception as e:
+        print("shaders unavailable:", e)
+        return None
+
+
+class InstanceBatch:
+    """Per-instance transforms and colours of every object sharing one mesh, drawn with one instanced call."""
+    def __init__(self, mesh):
+        self.mesh = mesh
+        self.objects = [] # object index of each row
+        self.rows = np.zeros((0, INSTANCE_FLOATS), dtype=np.float32) # grown by doubling, the first count rows are used
+        self.count = 0
+        self.dirty = set() # rows changed since the last upload
+        self.vbo = None
+        self.capacity = 0 # rows allocated in the vbo
+        self.visible_vbo = None # just the rows inside the frustum, when some are culled
+
+    @property
+    def data(self):
+        """The used rows, a view so writes go to the backing array."""
+        return self.rows[:self.count]
+
+    @data.setter
+    def data(self, rows):
+        self.rows, self.count = rows, len(rows)
+
+    def add(self, index, attributes):
+        if self.count == len(self.rows): # copy into twice the room, so n adds copy O(n) rows in total
+            rows = np.zeros((max(1, 2 * len(self.rows)), INSTANCE_FLOATS), dtype=np.float32)
+            rows[:self.count] = self.rows[:self.count]
+            self.rows = rows
+        self.rows[self.count] = instance_row(attributes)
+        self.count += 1
+        self.objects.append(index)
+        self.dirty.add(self.count - 1)
+        return self.count - 1
+
+    def set(self, row, attributes):
+        self.set_row(row, instance_row(attributes))
+
+    def set_row(self, row, values):
+        self.data[row] = values
+        self.dirty.add(row)
+
+    def upload(self):
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        if self.capacity < len(self.data):
+            self.capacity = max(len(self.data), 2 * self.capacity)
+            glBufferData(GL_ARRAY_BUFFER, self.capacity * INSTANCE_FLOATS * 4, None, GL_DYNAMIC_DRAW)
+            self.dirty = set(range(len(self.data)))
+        rows = sorted(self.dirty)
+        self.dirty = set()
+        start = 0
+        while start < len(rows): # one glBufferSubData per run of consecutive changed rows
+            end = start
+            while end + 1 < len(rows) and rows[end + 1] == rows[end] + 1:
+                end += 1
+            first, last = rows[start], rows[end] + 1
+            glBufferSubData(GL_ARRAY_BUFFER, first * INSTANCE_FLOATS * 4, (last - first) * INSTANCE_FLOATS * 4, self.data[first:last])
+            start = end + 1
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def spheres(self):
+        """World space centre and radius of each row's bounding sphere."""
+        columns = self.data[:, :16].reshape(-1, 4, 4) # column-major model matrices
+        centre, radius = self.mesh.sphere[:3], self.mesh.sphere[3]
+        world = np.einsum("njk,j->nk", columns[:, :3, :3], centre) + columns[:, 3, :3]
+        scale = np.linalg.norm(columns[:, :3, :3], axis=2).max(axis=1) # largest axis scale, 1 for rotations
+        return world, radius * scale
+
+    def cull(self, planes):
+        """Rows whose transformed bounding sphere is at least partly inside the frustum planes."""
+        world, radius = self.spheres()
+        distances = world @ planes[:, :3].T + planes[:, 3]
+        return np.all(distances >= -radius[:, None], axis=1)
+
+    def depths(self, view):
+        """Distance in front of the camera of each row's bounding sphere centre."""
+        world, radius = self.spheres()
+        return -(world @ view[2, :3] + view[2, 3])
+
+    def levels(self, view, pixels_per_unit, thresholds):
+        """Mesh level of each row: how many of the thresholds its bounding sphere's projected radius in pixels
+        is below, pixels_per_unit being the projected size of one unit at distance one."""
+        world, radius = self.spheres()
+        projected = radius * pixels_per_unit / np.maximum(self.depths(view), 1e-3)
+        level = np.count_nonzero(projected[:, None] < np.asarray(thresholds)[None, :], axis=1)
+        return np.minimum(level, len(self.mesh.lods))
+
+    def draw(self, visible=None, levels=None, tint=None):
+        """Draw every row, or only those where visible is set, one instanced call per mesh level in levels.
+        Rows that are not all drawn together are copied into a compact buffer first. tint replaces the colour
+        of each level's rows, to show which level is in use. Returns the number of draw calls."""
+        if self.dirty:
+            self.upload()
+        if visible is None:
+            visible = np.ones(len(self.objects), dtype=bool)
+        if levels is None:
+            levels = np.zeros(len(self.objects), dtype=np.int64)
+        draws = 0
+        for level in np.unique(levels[visible]):
+            selected = visible & (levels == level)
+            if tint is None and selected.all():
+                self.draw_rows(self.mesh.level_buffer(int(level)), self.vbo, len(self.objects))
+            else:
+                self.draw_selected(np.flatnonzero(selected), level, tint)
+            draws += 1
+        return draws
+
+    def draw_selected(self, rows, level, tint=None):
+        """Draw the given rows in that order with one instanced call, from a compact copy of just those rows."""
+        data = self.data[rows]
+        if tint is not None:
+            data[:, 16:] = tint[level]
+        if self.visible_vbo is None:
+            self.visible_vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.visible_vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STREAM_DRAW) # orphans the store the last call drew from
+        self.draw_rows(self.mesh.level_buffer(int(level)), self.visible_vbo, len(data))
+
+    def draw_rows(self, buffer, vbo, count):
+        stride = INSTANCE_FLOATS * 4
+        glBindBuffer(GL_ARRAY_BUFFER, buffer.vbo)
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
+        if buffer.nbo is not None:
+            glBindBuffer(GL_ARRAY_BUFFER, buffer.nbo)
+            glEnableVertexAttribArray(6)
+            glVertexAttribPointer(6, 3, GL_FLOAT, GL_FALSE, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        for location in range(1, 6): # four matrix columns, then colour
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p((location - 1) * 16))
+            glVertexAttribDivisor(location, 1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, buffer.ibo)
+        glDrawElementsInstanced(GL_TRIANGLES, buffer.count, GL_UNSIGNED_INT, None, count)
+        for location in range(7):
+            glVertexAttribDivisor(location, 0)
+            glDisableVertexAttribArray(location)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        for vbo in (self.vbo, self.visible_vbo):
+            if vbo is not None:
+                glDeleteBuffers(1, [vbo])
+
+
+class LightMarkers(InstanceBatch):
+    """Every light drawn as the same precomputed sphere in one instanced call. The rows hold just each light's
+    offset and colour, the parent object's transform is applied once for all of them, so the rows only have
+    to be packed and uploaded again when a light is added, recoloured or wiped."""
+    def __init__(self, radius=0.2, slices=10, stacks=10):
+        super().__init__(None)
+        self.vertices, self.triangles = sphere_mesh(radius, slices, stacks)
+        self.buffer = None
+        self.changed = True
+
+    def pack(self, lights):
+        self.data = np.zeros((len(lights), INSTANCE_FLOATS), dtype=np.float32)
+        self.data[:, [0, 5, 10, 15]] = 1 # identity matrix, column-major
+        self.data[:, 19] = 1
+        if lights:
+            self.data[:, 12:15] = [light[:3] for light in lights]
+            self.data[:, 16:19] = np.array([light[3] for light in lights]) / 255
+        self.dirty = set(range(len(lights)))
+        self.changed = False
+
+    def draw(self, instanced=True):
+        if self.buffer is None:
+            self.buffer = MeshBuffer(self.vertices, self.triangles)
+        if not instanced: # no shaders, still one draw of the same buffers per light
+            for row in self.data:
+                glColor4f(*row[16:])
+                glPushMatrix()
+                glTranslatef(*row[12:15])
+                self.buffer.draw()
+                glPopMatrix()
+            return len(self.data)
+        if self.dirty:
+            self.upload()
+        self.draw_rows(self.buffer, self.vbo, len(self.data))
+        return 1
+
+
+class TiledLights:
+    """Forward+ light lists for the lit shader: every frame the lights are binned on the CPU into the screen
+    tiles their range can touch, and the lights, the tiles and the lists go up as float textures, so each
+    fragment only adds up the lights of its own tile."""
+    index_width = 1024
+
+    def __init__(self, tile_size=16):
+        self.tile_size = tile_size
+        self.textures = None # lights, tiles, light_indexes
+        self.shape = (1, 1) # tiles_y, tiles_x
+        self.index_rows = 1
+        self.light_count = 1
+
+    def upload(self, texture, data):
+        """Replace a texture with an (h, w, 4) array as RGBA floats, or (h, w) as single red floats."""
+        glBindTexture(GL_TEXTURE_2D, texture)
+        internal, channels = (GL_RGBA32F, GL_RGBA) if data.ndim == 3 else (GL_R32F, GL_RED)
+        glTexImage2D(GL_TEXTURE_2D, 0, internal, data.shape[1], data.shape[0], 0, channels, GL_FLOAT, np.ascontiguousarray(data, dtype=np.float32))
+
+    def update(self, positions, ranges, colours, view, projection, viewport):
+        """Bin the lights (world positions, ranges, rgb 0-1) for this frame's camera. Returns the number of (light, tile) pairs."""
+        if self.textures is None:
+            self.textures = glGenTextures(3)
+            for texture in self.textures:
+                glBindTexture(GL_TEXTURE_2D, texture)
+                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        grid, indexes = tile_lights(positions, ranges, view, projection, viewport, self.tile_size)
+        self.shape, self.light_count = grid.shape[:2], max(len(positions), 1)
+        self.index_rows = max(-(-len(indexes) // self.index_width), 1)
+        lights = np.zeros((2, self.light_count, 4))
+        lights[0, :len(positions), :3], lights[0, :len(positions), 3], lights[1, :len(positions), :3] = positions, ranges, colours
+        tiles = np.zeros(grid.shape[:2] + (4,))
+        tiles[..., :2] = grid
+        flat = np.zeros(self.index_rows * self.index_width, dtype=np.float32)
+        flat[:len(indexes)] = indexes
+        self.upload(self.textures[0], lights)
+        self.upload(self.textures[1], tiles)
+        self.upload(self.textures[2], flat.reshape(self.index_rows, self.index_width))
+        glBindTexture(GL_TEXTURE_2D, 0)
+        return len(indexes)
+
+    def bind(self, program, ambient):
+        for unit, (name, texture) in enumerate(zip(("lights", "tiles", "light_indexes"), self.textures), 1):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glUniform1i(glGetUniformLocation(program, name), unit)
+        glActiveTexture(GL_TEXTURE0)
+        glUniform1f(glGetUniformLocation(program, "light_count"), self.light_count)
+        glUniform2f(glGetUniformLocation(program, "tile_count"), self.shape[1], self.shape[0])
+        glUniform1f(glGetUniformLocation(program, "tile_size"), self.tile_size)
+        glUniform2f(glGetUniformLocation(program, "index_size"), self.index_width, self.index_rows)
+        glUniform1f(glGetUniformLocation(program, "ambient"), ambient)
+
+    def unbind(self):
+        for unit in (1, 2, 3):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_2D, 0)
+        glActiveTexture(GL_TEXTURE0)
+
+
+class MeshCache:
+    """Parses each distinct OBJ file once and hands the same ObjLoader to every object that uses it."""
+    def __init__(self):
+        self.entries = {} # normalised path -> [ObjLoader, reference count]
+        self.lock = threading.Lock() # objects are created from the file reader thread as well as the GUI
+        self.stale_buffers = []
+
+    def key(self, path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def acquire(self, path):
+        with self.lock:
+            entry = self.entries.get(self.key(path))
+            if entry is None:
+                entry = self.entries[self.key(path)] = [ObjLoader(path), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, mesh):
+        with self.lock:
+            entry = self.entries.get(self.key(mesh.path))
+            if entry is None or entry[0] is not mesh:
+                return
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.entries[self.key(mesh.path)]
+                self.stale_buffers.extend(mesh.buffers.values()) # can only be deleted with the GL context current
+                mesh.buffers = {}
+
+    def discard(self, buffer):
+        with self.lock:
+            self.stale_buffers.append(buffer)
+
+    def free_stale(self):
+        with self.lock:
+            stale, self.stale_buffers = self.stale_buffers, []
+        for buffer in stale:
+            buffer.delete()
+
+
+def load_label_font(size):
+    for name in ("arial.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size)
+    except TypeError: # Pillow before 10.1 only has the fixed size bitmap font
+        return ImageFont.load_default()
+
+
+class LabelAtlas:
+    """Rasterises each distinct label once into rows of one shared texture and draws a frame's labels in one call.
+    When the texture is full the least recently drawn labels are evicted to make room."""
+    padding = 12
+    gap = 100 # labels end this far left of their anchor
+
+    def __init__(self, width=2048, height=1024, font_size=24):
+        self.width, self.height = width, height
+        self.font = load_label_font(font_size)
+        ascent, descent = self.font.getmetrics()
+        self.row_height = ascent + descent + 2 * self.padding
+        self.free = [[(0, width)] for _ in range(height // self.row_height)] # free (x, width) spans in each row
+        self.labels = collections.OrderedDict() # text -> (row, x, w, h), least recently drawn first
+        self.frame = 0
+        self.drawn = {} # text -> frame it was last drawn in
+        self.texture = None
+        self.uploads = 0 # glTexSubImage2D calls, read and reset by the profiler
+
+    def rasterise(self, text):
+        bbox = ImageDraw.Draw(Image.new("RGBA", (1, 1))).multiline_textbbox((0, 0), text, font=self.font)
+        w = min(bbox[2] - bbox[0] + 2 * self.padding, self.width)
+        h = min(bbox[3] - bbox[1] + 2 * self.padding, self.row_height)
+        img = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+        ImageDraw.Draw(img).multiline_text((self.padding, self.padding), text, font=self.font, fill=(255, 255, 255, 255))
+        return np.array(img.transpose(Image.Transpose.FLIP_TOP_BOTTOM), dtype=np.uint8)
+
+    def allocate(self, w):
+        for row, spans in enumerate(self.free):
+            for i, (x, span) in enumerate(spans):
+                if span >= w:
+                    spans[i:i + 1] = [(x + w, span - w)] if span > w else []
+                    return row, x
+        return None
+
+    def release(self, row, x, w):
+        spans = sorted(self.free[row] + [(x, w)])
+        merged = [spans[0]]
+        for x, w in spans[1:]:
+            if merged[-1][0] + merged[-1][1] == x:
+                merged[-1] = (merged[-1][0], merged[-1][1] + w)
+            else:
+                merged.append((x, w))
+        self.free[row] = [span for span in merged if span[1] > 0]
+
+    def get(self, text):
+        """Atlas rectangle of a label, rasterising and uploading it if it isn't there yet. None if it can't fit this frame."""
+        if text in self.labels:
+            self.labels.move_to_end(text)
+            return self.labels[text]
+        pixels = self.rasterise(text)
+        h, w = pixels.shape[:2]
+        place = self.allocate(w)
+        while place is None and self.labels:
+            oldest = next(iter(self.labels))
+            if self.drawn.get(oldest) == self.frame: # everything left is on screen right now
+                return None
+            row, x, old_w, old_h = self.labels.pop(oldest)
+            self.drawn.pop(oldest, None)
+            self.release(row, x, old_w)
+            place = self.allocate(w)
+        if place is None:
+            return None
+        row, x = place
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, x, row * self.row_height, w, h, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+        self.uploads += 1
+        self.labels[text] = (row, x, w, h)
+        return self.labels[text]
+
+    def create_texture(self):
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.width, self.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+
+    def draw(self, labels, left_aligned=False):
+        """Draw (x, y, text) labels as one batch of textured quads, in the current (pixel) projection.
+        Labels end self.gap left of x, or start at x when left_aligned."""
+        if self.texture is None:
+            self.create_texture()
+        self.frame += 1
+        corners, uvs = [], []
+        for winX, winY, text in labels:
+            rect = self.get(text)
+            if rect is None:
+                continue
+            self.drawn[text] = self.frame
+            row, x, w, h = rect
+            left = winX if left_aligned else winX - w - self.gap
+            u0, v0 = x / self.width, row * self.row_height / self.height
+            u1, v1 = (x + w) / self.width, (row * self.row_height + h) / self.height
+            corners += [(left, winY), (left + w, winY), (left + w, winY + h), (left, winY + h)]
+            uvs += [(u0, v0), (u1, v0), (u1, v1), (u0, v1)]
+        if not corners:
+            return
+        corners = np.array(corners, dtype=np.float32)
+        uvs = np.array(uvs, dtype=np.float32)
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glColor3f(1, 1, 1)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, corners)
+        glTexCoordPointer(2, GL_FLOAT, 0, uvs)
+        glDrawArrays(GL_QUADS, 0, len(corners))
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisable(GL_TEXTURE_2D)
+
+
+class FrameProfiler:
+    """Time spent per section of each frame, GPU time and per-frame counters, kept for the last `history` frames
+    for the overlay and for CSV / JSON export. Section times are in milliseconds under "<name>_ms"."""
+    history = 600
+    spark = "▁▂▃▄▅▆▇█"
+
+    def __init__(self):
+        self.frames = collections.deque(maxlen=self.history) # one dict per finished frame
+        self.current = collections.defaultdict(float) # sections and counters of the frame in progress
+        self.started = self.last_started = None
+        self.queries = None # GL_TIME_ELAPSED queries used round robin, so results are read a few frames later without stalling
+        self.query_frame = 0
+        self.gpu_ms = math.nan
+        self.overlay, self.overlay_time = [], 0.0 # overlay lines, rebuilt a few times a second
+
+    @contextlib.contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name + "_ms"] += (time.perf_counter() - start) * 1000
+
+    def count(self, name, n=1):
+        self.current[name] += n
+
+    def begin_frame(self):
+        self.last_started, self.started = self.started, time.perf_counter()
+        if self.queries is None:
+            try:
+                self.queries = list(glGenQueries(4)) if bool(glGenQueries) and bool(glBeginQuery) else []
+            except GLError: # no timer queries, CPU times only
+                self.queries = []
+        self.gpu_ms = math.nan # GPU time of an earlier frame, when its query has finished
+        if self.queries:
+            query = self.queries[self.query_frame % len(self.queries)]
+            # the slot holds the query of len(queries) frames ago. The very first query's result is skipped (read at
+            # query_frame == len(queries)), llvmpipe reports a timestamp rather than the elapsed time for it
+            if self.query_frame > len(self.queries) and glGetQueryObjectuiv(query, GL_QUERY_RESULT_AVAILABLE):
+                result = ctypes.c_uint64() # the wrapped glGetQueryObjectui64v can't convert 64 bit outputs
+                GL_3_3.glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(result))
+                self.gpu_ms = result.value / 1e6
+            glBeginQuery(GL_TIME_ELAPSED, query)
+
+    def end_frame(self):
+        if self.queries:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.query_frame += 1
+        self.current["frame_ms"] = (time.perf_counter() - self.started) * 1000
+        self.current["gpu_ms"] = self.gpu_ms
+        if self.last_started is not None:
+            self.current["interval_ms"] = (self.started - self.last_started) * 1000
+        self.current["time"] = time.time()
+        self.frames.append(dict(self.current))
+        self.current.clear()
+
+    def columns(self):
+        names = {name: None for frame in self.frames for name in frame}
+        return ["time"] + sorted(name for name in names if name != "time")
+
+    def summary(self):
+        """mean, p50, p95, max and a 10 bin histogram of every column over the kept frames."""
+        result = {}
+        for name in self.columns()[1:]:
+            values = np.array([frame.get(name, 0.0) for frame in self.frames], dtype=float)
+            values = values[~np.isnan(values)]
+            if len(values) == 0:
+                continue
+            counts, edges = np.histogram(values, bins=10)
+            result[name] = {"mean": float(values.mean()), "p50": float(np.percentile(values, 50)),
+                            "p95": float(np.percentile(values, 95)), "max": float(values.max()),
+                            "histogram": counts.tolist(), "edges": edges.tolist()}
+        return result
+
+    def overlay_lines(self):
+        if time.perf_counter() - self.overlay_time < 0.25 or not self.frames:
+            return self.overlay
+        self.overlay_time = time.perf_counter()
+        summary = self.summary()
+        lines = []
+        if "interval_ms" in summary:
+            lines.append(f"{1000 / summary['interval_ms']['mean']:.0f} fps")
+        for name, stats in summary.items():
+            if name.endswith("_ms") and name != "interval_ms":
+                peak = max(stats["histogram"])
+                spark = "".join(self.spark[(len(self.spark) - 1) * c // peak] for c in stats["histogram"])
+                lines.append(f"{name[:-3]} {stats['mean']:.2f} avg {stats['p95']:.2f} p95 {stats['max']:.2f} max ms {spark}")
+        for name, stats in summary.items():
+            if not name.endswith("_ms"):
+                lines.append(f"{name.replace('_', ' ')} {stats['mean']:.1f} per frame, {stats['max']:.0f} max")
+        self.overlay = lines
+        return lines
+
+    def export_csv(self, path):
+        columns = self.columns()
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for frame in self.frames:
+                writer.writerow([frame.get(name, "") for name in columns])
+
+    def export_json(self, path):
+        with open(path, "w") as file:
+            json.dump({"summary": self.summary(), "frames": list(self.frames)}, file)
 
 
 class DraggableLight(QLabel):
@@ -91,23 +1226,51 @@ class DraggableLight(QLabel):
 
             drag.exec(Qt.DropAction.MoveAction)
 
+LOD_COLOURS = np.array([(0.2, 0.9, 0.2, 1), (0.9, 0.9, 0.2, 1), (1.0, 0.5, 0.1, 1), (0.9, 0.2, 0.2, 1)], dtype=np.float32) # level 0, 1, 2, 3
+
 class OpenGLWidget(QOpenGLWidget):
+    lod_pixels = (60, 25, 10) # projected bounding sphere radius in pixels below which each further mesh level is drawn
+    light_range = 1.5 # distance at which a light's contribution has faded to nothing
+    ambient = 0.6 # brightness of surfaces facing down with no light on them, facing up is 1
+
     def __init__(self, obj_path=None,obj_info=None):
         super().__init__()
-        self.sphere=gluNewQuadric()
+        self.meshes = MeshCache()
         self.objs = None
         self.obj_attributes = None
         self.labelbool=None
+        self.batches = {} # mesh -> InstanceBatch of every object drawn with it
+        self.instance_of = [] # (batch, row) holding each object's instance data
+        self.motion = {} # object index -> (t0, attributes0, t1, attributes1) while moving between two samples
+        self.light_pose = None # parent transform of the lights blended along with the first object, None when it is still
+        self.time_source = None # playback clock motion is interpolated against
+        self.profiler = FrameProfiler()
+        self.visible = np.zeros(0, dtype=bool) # objects inside the view frustum in the last frame
+        self.levels = np.zeros(0, dtype=np.int64) # mesh level each object was drawn with in the last frame
+        self.translucent_order = np.zeros(0, dtype=np.int64) # translucent objects back to front in the last frame
+        self.show_profile = False
+        self.show_lod = False # colour objects by mesh level instead of their own colour
+        self.program = None
+        self.lit_program = None
+        self.lighting = True # shade the objects and let the lights shine on them, needs the lit program
+        self.tiled_lights = TiledLights()
+        self.label_atlas = LabelAtlas()
+        self.profile_atlas = LabelAtlas(1024, 512, font_size=13) # smaller text for the timing overlay
         if obj_path is not None and obj_info is not None:
-            self.objs = [ObjLoader(obj_path)]
+            self.objs = [self.meshes.acquire(obj_path)]
             self.obj_attributes = [obj_info] # syntax: [[x,y,z],color,[angle_x,angle_y,angle_z],transparency,name] in reference to each object at the same index
             self.labelbool=[1]
+            self.add_instance(0)
         self.lights = []  # Store lights as (x, y, z, color) tuples
+        self.light_markers = LightMarkers()
         self.last_mouse_pos = None  # Track the last mouse position for movement
         self.angle_x = 0
         self.angle_y = 0
         self.obj_angle_x = 0 # for rotation within anchor mode
         self.obj_angle_y = 0
+        self.view = np.identity(4) # camera and projection matrices, mirrored from what is loaded into GL
+        self.projection = np.identity(4)
+        self.viewport = (0, 0, 1, 1)
         self.lastangle_x = 0
         self.lastangle_y = 0        
         self.last_x = 0
@@ -125,7 +1288,6 @@ class OpenGLWidget(QOpenGLWidget):
         self.Zcorrection = 1
         self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
         self.transparency = 0.4
-        self.mutex=False
         
     
     def initializeGL(self):
@@ -133,131 +1295,175 @@ class OpenGLWidget(QOpenGLWidget):
         glClearColor(0.1, 0.1, 0.1, 1.0)
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)        
+        if bool(glDrawElementsInstanced) and bool(glVertexAttribDivisor):
+            self.program = build_program(INSTANCE_VERTEX_SHADER, INSTANCE_FRAGMENT_SHADER, INSTANCE_ATTRIBUTES)
+            self.lit_program = build_program(LIT_VERTEX_SHADER, LIT_FRAGMENT_SHADER, INSTANCE_ATTRIBUTES)
 
     def resizeGL(self, width, height):
         glViewport(0, 0, width, height)  
+        self.viewport = (0, 0, width, height)
+        self.projection = perspective(60, width / height, 0.1, 100.0)
         glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        gluPerspective(60, width / height, 0.1, 100.0)  
+        glLoadMatrixf(self.projection.T)
         glMatrixMode(GL_MODELVIEW)
 
+    def view_matrix(self):
+        return (rotation(self.angle_x, (1, 0, 0)) @ rotation(self.angle_y, (0, 1, 0)) # free camera rotation
+                @ translation(self.positionX, self.positionY, self.positionZ) # translation in free camera mode
+                @ rotation(self.obj_angle_x, (1, 0, 0)) @ rotation(self.obj_angle_y, (0, 1, 0)) # rotation within anchor mode
+                @ translation(self.orbitX, self.orbitY, self.orbitZ)) # position in anchor mode
+
     def paintGL(self):
+        self.profiler.begin_frame()
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)  
-        glLoadIdentity()
-        
-        
-        
-        glRotatef(self.angle_x, 1, 0, 0)  # Rotate on X-axis, for free camera mode
-        glRotatef(self.angle_y, 0, 1, 0)  # Rotate on Y-axis
-        
-        glTranslatef(self.positionX, self.positionY, self.positionZ)  #translation in free camera mode
-        
-
-        glRotatef(self.obj_angle_x, 1, 0, 0) # rotation within anchor mode
-        glRotatef(self.obj_angle_y, 0, 1, 0)     
-        
-        glTranslatef(self.orbitX, self.orbitY, self.orbitZ)#position in anchor mode
-        while(self.mutex):
-            time.sleep(0.2)
-        self.mutex=True
-        self.draw_grass()
-        self.draw_lights()        
+        self.view = self.view_matrix() # kept here too so labels can be projected without reading GL state back
+        glLoadMatrixf(self.view.T)
+        self.meshes.free_stale()
+        if self.motion and self.time_source is not None:
+            with self.profiler.section("interpolate"):
+                self.interpolate(self.time_source())
+        if self.lighting and self.lit_program is not None:
+            with self.profiler.section("light_cull"): # before drawing, replacing textures waits for queued draws
+                self.cull_lights()
+        with self.profiler.section("grass"):
+            self.draw_grass()
+        with self.profiler.section("lights"):
+            self.draw_lights()        
         self.draw_obj()  # Draw the object
-        self.mutex=False
+        self.profiler.count("texture_uploads", self.label_atlas.uploads + self.profile_atlas.uploads)
+        self.label_atlas.uploads = self.profile_atlas.uploads = 0
+        self.profiler.end_frame()
+
+    def set_motion(self, index, t0, attributes0, t1, attributes1):
+        """Move an object from one sample to the next as playback time goes from t0 to t1."""
+        self.motion[index] = (t0, attributes0, t1, attributes1)
+
+    def interpolate(self, t):
+        indexes = list(self.motion)
+        if 0 in self.motion: # the lights ride on the first object, blend their parent the same way but without the roll
+            t0, attributes0, t1, attributes1 = self.motion[0]
+            pitch_yaw = [[a[0], a[1], [a[2][0], a[2][1], 0], a[3], a[4]] for a in (attributes0, attributes1)]
+            self.light_pose = interpolated_rows(t, [(t0, pitch_yaw[0], t1, pitch_yaw[1])])[0][:16].reshape(4, 4).T
+        rows = interpolated_rows(t, [self.motion[i] for i in indexes])
+        for index, row in zip(indexes, rows):
+            batch, batch_row = self.instance_of[index]
+            batch.set_row(batch_row, row)
+            if t >= self.motion[index][2]: # reached the next sample, its MODIFY takes over from here
+                del self.motion[index]
+        if self.camera_state==2 and 0 in indexes: # anchor mode follows the blended position
+            obj_center = self.objs[0].center
+            position = rows[indexes.index(0)][12:15]
+            self.orbitX = -obj_center[0] - position[0]
+            self.orbitY = -obj_center[1] - position[1]
+            self.orbitZ = -obj_center[2] - position[2]
 
     def draw_obj(self):
-        index = -1
         projected_labels=[]
         if self.objs != []:
-            for x in self.objs:
-                index += 1
-                glColor4f(self.obj_attributes[index][1][0]/255,self.obj_attributes[index][1][1]/255,self.obj_attributes[index][1][2]/255, self.obj_attributes[index][3])
-                 
-                glPushMatrix()
-                glTranslatef(self.obj_attributes[index][0][0],self.obj_attributes[index][0][1],self.obj_attributes[index][0][2]) 
-                glRotatef(self.obj_attributes[index][2][0],1,0,0)
-                glRotatef(self.obj_attributes[index][2][1],0,1,0)
-                glRotatef(self.obj_attributes[index][2][2],0,0,1)
-                
-                #[[x,y,z],color,[angle_x,angle_y],transparency,label]
-                glBegin(GL_TRIANGLES) 
-                for face in x.faces:
-                    if len(face) == 3:
-                        for vertex_idx in face:
-                            glVertex3fv(x.vertices[vertex_idx])
-                    elif len(face) == 4:
-                        glVertex3fv(x.vertices[face[0]])
-                        glVertex3fv(x.vertices[face[1]])
-                        glVertex3fv(x.vertices[face[2]])
-                        glVertex3fv(x.vertices[face[0]])
-                        glVertex3fv(x.vertices[face[2]])
-                        glVertex3fv(x.vertices[face[3]])
-
-                glEnd()
-                #draw label for each object
-                if self.labelbool[index]==1 and self.objs != []:
-                    modelview = glGetDoublev(GL_MODELVIEW_MATRIX)
-                    projection = glGetDoublev(GL_PROJECTION_MATRIX)
-                    viewport = glGetIntegerv(GL_VIEWPORT)
-                    winX, winY, winZ = gluProject(0,0,0, modelview, projection, viewport)
-                
-                    projected_labels.append((winX, winY, self.obj_attributes[index][4]))
-                
+            with self.profiler.section("cull"):
+                planes = frustum_planes(self.projection @ self.view)
+                pixels_per_unit = self.projection[1, 1] * self.viewport[3] / 2
+                self.visible = np.zeros(len(self.objs), dtype=bool)
+                self.levels = np.zeros(len(self.objs), dtype=np.int64)
+                opaque = np.zeros(len(self.objs), dtype=bool)
+                masks, levels = {}, {}
+                for batch in self.batches.values():
+                    masks[batch] = batch.cull(planes)
+                    levels[batch] = batch.levels(self.view, pixels_per_unit, self.lod_pixels)
+                    self.visible[batch.objects] = masks[batch]
+                    self.levels[batch.objects] = levels[batch]
+                    opaque[batch.objects] = batch.data[:, 19] >= 1
+                self.profiler.count("culled", len(self.objs) - np.count_nonzero(self.visible))
+                for level, count in enumerate(np.bincount(self.levels[self.visible], minlength=len(LOD_COLOURS))):
+                    self.profiler.count(f"lod{level}_objects", count)
+            tint = LOD_COLOURS if self.show_lod else None
+            with self.profiler.section("objects"): # opaque first, they fill the depth buffer the translucent ones test against
+                if self.program is not None:
+                    self.use_object_program()
+                    for batch, visible in masks.items():
+                        visible = visible & (batch.data[:, 19] >= 1)
+                        if visible.any():
+                            self.profiler.count("draw_calls", batch.draw(visible, levels[batch], tint))
+                    glUseProgram(0)
+                    self.tiled_lights.unbind()
+                else: # no instancing, one draw call per object
+                    for index in np.flatnonzero(self.visible & opaque):
+                        self.draw_single(index, tint)
+                        self.profiler.count("draw_calls")
+            with self.profiler.section("translucent"):
+                order = self.sort_translucent(self.visible & ~opaque)
+                self.profiler.count("translucent", len(order))
+                glDepthMask(GL_FALSE) # blended in order instead, hidden parts of farther objects still show through
+                if self.program is not None:
+                    self.use_object_program()
+                    start = 0
+                    while start < len(order): # one instanced call per run of neighbours sharing a mesh and level
+                        batch, level = self.instance_of[order[start]][0], self.levels[order[start]]
+                        end = start + 1
+                        while end < len(order) and self.instance_of[order[end]][0] is batch and self.levels[order[end]] == level:
+                            end += 1
+                        batch.draw_selected([self.instance_of[index][1] for index in order[start:end]], level, tint)
+                        self.profiler.count("draw_calls")
+                        start = end
+                    glUseProgram(0)
+                    self.tiled_lights.unbind()
+                else:
+                    for index in order:
+                        self.draw_single(index, tint)
+                        self.profiler.count("draw_calls")
+                glDepthMask(GL_TRUE)
+
+        with self.profiler.section("labels"):
+            if self.objs != []:
+                projected_labels = self.project_labels()
+            self.draw_labels(projected_labels)
+
+    def sort_translucent(self, translucent):
+        """Indexes of the translucent objects back to front by view space depth. The sort starts from last frame's
+        order, which is usually still right or close to it, so the stable sort (a merge of runs) is close to linear."""
+        previous = self.translucent_order[self.translucent_order < len(translucent)]
+        previous = previous[translucent[previous]]
+        known = np.zeros(len(translucent), dtype=bool)
+        known[previous] = True
+        order = np.concatenate((previous, np.flatnonzero(translucent & ~known)))
+        depths = np.zeros(len(translucent))
+        for batch in self.batches.values():
+            depths[batch.objects] = batch.depths(self.view)
+        order = order[np.argsort(-depths[order], kind="stable")]
+        self.profiler.count("reordered", np.count_nonzero(order[:len(previous)] != previous))
+        self.translucent_order = order
+        return order
+
+    def draw_single(self, index, tint=None):
+        batch, row = self.instance_of[index]
+        glColor4f(*(batch.data[row][16:] if tint is None else tint[self.levels[index]]))
+        glPushMatrix()
+        glMultMatrixf(batch.data[row][:16])
+        self.objs[index].level_buffer(int(self.levels[index])).draw()
+        glPopMatrix()
 
-                
-                glPopMatrix()
-        self.draw_labels(projected_labels)
+    def project_labels(self):
+        """Window position and text of each labelled object that survived culling, all anchors projected in one go.
+        Anchors behind the camera or outside the viewport are dropped."""
+        count = len(self.objs)
+        anchors = np.ones((count, 4))
+        for batch in self.batches.values():
+            anchors[batch.objects, :3] = batch.data[:, 12:15] # translation column of each model matrix
+        candidates = np.flatnonzero((np.array(self.labelbool[:count]) == 1) & self.visible[:count])
+        clip = anchors[candidates] @ (self.projection @ self.view).T
+        w = clip[:, 3]
+        visible = w > 1e-6
+        w = np.where(visible, w, 1.0)
+        ndc_x, ndc_y = clip[:, 0] / w, clip[:, 1] / w
+        visible &= (np.abs(ndc_x) <= 1) & (np.abs(ndc_y) <= 1)
+        x, y, width, height = self.viewport
+        win_x = x + width * (ndc_x + 1) / 2
+        win_y = y + height * (ndc_y + 1) / 2
+        return [(win_x[i], win_y[i], self.obj_attributes[candidates[i]][4]) for i in np.flatnonzero(visible)]
   
-    def create_text_texture(self,text, font_size=24):
-            font = ImageFont.truetype("arial.ttf", font_size)
-            padding=12
-            dummy_img = Image.new("RGBA", (1, 1))
-            dummy_draw = ImageDraw.Draw(dummy_img)
-            bbox = dummy_draw.multiline_textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            texture_width = text_width + 2 * padding + 100
-            texture_height = text_height + 2 * padding
-
-            img = Image.new("RGBA", (texture_width, texture_height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(img)
-            
-            draw.multiline_text((padding, padding), text, font=font, fill=(255, 255, 255, 255))
-            img = img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
-            img_data = np.array(img.convert("RGBA"), dtype=np.uint8)
-
-            texture_id = glGenTextures(1)
-            glBindTexture(GL_TEXTURE_2D, texture_id)
-            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
-    
-            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, texture_width, texture_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
-    
-            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
-            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-
-            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
-            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
-
-
-            return texture_id, texture_width, texture_height
-
-    def draw_textured_quad(self,x, y, w, h, texture_id):
-        glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, texture_id)
-        
-        glColor3f(1, 1, 1)
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, 0); glVertex2f(x, y)
-        glTexCoord2f(1, 0); glVertex2f(x + w, y)
-        glTexCoord2f(1, 1); glVertex2f(x + w, y + h)
-        glTexCoord2f(0, 1); glVertex2f(x, y + h)
-        glEnd()
-
-        glDisable(GL_TEXTURE_2D)
-
     def draw_labels(self, labels):
-        if not labels:
+        overlay = self.profiler.overlay_lines() if self.show_profile else []
+        if not labels and not overlay:
             return
 
         glDepthMask(GL_FALSE)
@@ -277,11 +1483,14 @@ class OpenGLWidget(QOpenGLWidget):
         glLoadIdentity()
         
         glDisable(GL_DEPTH_TEST)
-        glDepthFunc(GL_ALWAYS)
-        for winX, winY, label_text in labels:
-            texture_id, tex_w, tex_h = self.create_text_texture(label_text)
-            self.draw_textured_quad((winX - tex_w), winY,  tex_w, tex_h, texture_id)
-            glDeleteTextures([texture_id])
+        if labels:
+            self.label_atlas.draw(labels)
+            self.profiler.count("draw_calls")
+        if overlay: # top left, one atlas entry per line
+            step = self.profile_atlas.row_height - 2 * self.profile_atlas.padding + 2 # line height, without the padding
+            top = offset_y + height - self.profile_atlas.row_height + self.profile_atlas.padding - 4
+            self.profile_atlas.draw([(offset_x, top - i * step, line) for i, line in enumerate(overlay)], left_aligned=True)
+            self.profiler.count("draw_calls")
         
         glDepthMask(GL_TRUE)
         glEnable(GL_DEPTH_TEST)
@@ -293,6 +1502,7 @@ class OpenGLWidget(QOpenGLWidget):
         
 
     def draw_grass(self):
+        self.profiler.count("draw_calls")
         glColor3f(0.0, 0.5, 0.0)
         glBegin(GL_QUADS)
         glVertex3f(-10.0, -1.0, -10.0)
@@ -301,30 +1511,78 @@ class OpenGLWidget(QOpenGLWidget):
         glVertex3f(-10.0, -1.0, 10.0)
         glEnd()
 
+    def lights_changed(self):
+        """Call after adding, recolouring or removing lights, so their packed rows are rebuilt on the next frame."""
+        self.light_markers.changed = True
+        self.update()
+
+    def light_parent(self):
+        """Transform of the lights, which sit on the first object: its position and x, y rotation."""
+        if self.light_pose is not None:
+            return self.light_pose
+        position, angles = self.obj_attributes[0][0], self.obj_attributes[0][2]
+        return translation(*position) @ rotation(angles[0], (1, 0, 0)) @ rotation(angles[1], (0, 1, 0))
+
+    def cull_lights(self):
+        """World positions of the lights, binned into the screen tiles they reach for the lit shader."""
+        positions, colours = np.zeros((0, 3)), np.zeros((0, 3))
+        if self.lights and self.obj_attributes:
+            if self.light_markers.changed:
+                self.light_markers.pack(self.lights)
+            parent = self.light_parent()
+            positions = self.light_markers.data[:, 12:15] @ parent[:3, :3].T + parent[:3, 3]
+            colours = self.light_markers.data[:, 16:19]
+        pairs = self.tiled_lights.update(positions, np.full(len(positions), self.light_range), colours,
+                                         self.view, self.projection, self.viewport)
+        self.profiler.count("light_tiles", pairs)
+
+    def use_object_program(self):
+        """Lit program with this frame's light tiles bound when lighting is on, else the flat colour one."""
+        if self.lighting and self.lit_program is not None and not self.show_lod:
+            glUseProgram(self.lit_program)
+            self.tiled_lights.bind(self.lit_program, self.ambient)
+        else:
+            glUseProgram(self.program)
+
     def draw_lights(self):
-        if self.lights.__len__ != 0:
-            for x, y, z, color in self.lights:
-                glColor3f(color[0] / 255.0, color[1] / 255.0, color[2] / 255.0)
-                glPushMatrix()
-               
-                glTranslatef(self.obj_attributes[0][0][0],self.obj_attributes[0][0][1],self.obj_attributes[0][0][2])          
-                glRotatef(self.obj_attributes[0][2][0],1,0,0)# translate,rotate,rotate to helis current position
-                glRotatef(self.obj_attributes[0][2][1],0,1,0)
-                glTranslatef(x, y, z)#translate to lights position on heli
-                gluSphere(self.sphere,0.2, 10,10)
-                glPopMatrix()
+        if not self.lights or not self.obj_attributes:
+            return
+        if self.light_markers.changed:
+            self.light_markers.pack(self.lights)
+        glPushMatrix()
+        glMultMatrixf(self.light_parent().T) # translate,rotate,rotate to helis current position
+        if self.program is not None:
+            glUseProgram(self.program)
+            self.profiler.count("draw_calls", self.light_markers.draw())
+            glUseProgram(0)
+        else:
+            self.profiler.count("draw_calls", self.light_markers.draw(instanced=False))
+        glPopMatrix()
     
     
 
 
-    def add_secondary(self,path,attributes): #for adding secondary objects during runtime
-        self.objs.append(ObjLoader(path))
+    def add_secondary(self,path,attributes,mesh=None): #for adding secondary objects during runtime, mesh if already acquired
+        self.objs.append(mesh if mesh is not None else self.meshes.acquire(path))
         self.obj_attributes.append(attributes)
         self.labelbool.append(1)
+        self.add_instance(len(self.objs) - 1)
         self.update()
+
+    def add_instance(self, index):
+        mesh = self.objs[index]
+        if mesh not in self.batches:
+            self.batches[mesh] = InstanceBatch(mesh)
+        batch = self.batches[mesh]
+        self.instance_of.append((batch, batch.add(index, self.obj_attributes[index])))
     
     def edit_obj(self,index,attributes):
         self.obj_attributes[index]=attributes
+        self.motion.pop(index, None)
+        if index == 0:
+            self.light_pose = None
+        batch, row = self.instance_of[index]
+        batch.set(row, attributes)
         if self.camera_state==2 and index==0:
             obj_center = self.objs[0].center
             self.orbitX = -obj_center[0] - self.obj_attributes[0][0][0]
@@ -358,6 +1616,16 @@ class OpenGLWidget(QOpenGLWidget):
         """Handle key press events."""
         if event.key() == Qt.Key.Key_Space:
             self.camera_state = 1 - self.camera_state
+        elif event.key() == Qt.Key.Key_F3: # frame timing overlay
+            self.show_profile = not self.show_profile
+        elif event.key() == Qt.Key.Key_F6: # colour objects by mesh level, green full detail to red coarsest
+            self.show_lod = not self.show_lod
+        elif event.key() == Qt.Key.Key_F7: # lit or flat colour objects
+            self.lighting = not self.lighting
+        elif event.key() == Qt.Key.Key_F4 or event.key() == Qt.Key.Key_F5: # save the kept frames as CSV / JSON
+            path = time.strftime("profile_%Y%m%d_%H%M%S") + (".csv" if event.key() == Qt.Key.Key_F4 else ".json")
+            self.profiler.export_csv(path) if event.key() == Qt.Key.Key_F4 else self.profiler.export_json(path)
+            print("wrote", path)
                       
             
         self.update()  # Trigger repaint
@@ -408,14 +1676,19 @@ class OpenGLWidget(QOpenGLWidget):
             self.update()
 
     def wipe(self):
-        while(self.mutex):
-            time.sleep(0.2)
-        self.mutex=True
+        for x in self.objs:
+            self.meshes.release(x)
+        for batch in self.batches.values():
+            self.meshes.discard(batch)
+        self.batches = {}
+        self.instance_of = []
+        self.motion = {}
+        self.light_pose = None
         self.objs=[]
         self.obj_attributes=[]
+        self.labelbool=[]
         self.lights=[]
-        self.update()
-        self.mutex=False
+        self.lights_changed()
         
     def select_light(self,value):
         pass
@@ -457,7 +1730,7 @@ class OpenGLWidget(QOpenGLWidget):
     def change_light_colour(self,index, colour):
         light = self.lights[index]                   
         self.lights[index] = (light[0],light[1],light[2],colour)
-        self.update()
+        self.lights_changed()
     
 
 
@@ -518,12 +1791,12 @@ class Viewer2DCanvas(QWidget):
     def handle_click(self, event):
         if event.inaxes is not None:
             lx, ly = event.xdata, event.ydata
-            if self.view_mode == "Top":
-                closest_vertex = self.obj.find_closest_vertex(lx, 0, ly)
+            if self.view_mode == "Top": # match on the plane shown, the hidden coordinate is free
+                closest_vertex = self.obj.find_closest_vertex(lx, 0, ly, axes=(0, 2))
             elif self.view_mode == "Front":
-                closest_vertex = self.obj.find_closest_vertex(lx, ly, 0)
+                closest_vertex = self.obj.find_closest_vertex(lx, ly, 0, axes=(0, 1))
             elif self.view_mode == "Side":
-                closest_vertex = self.obj.find_closest_vertex(0, ly, lx)
+                closest_vertex = self.obj.find_closest_vertex(0, ly, lx, axes=(1, 2))
             
             if closest_vertex:
                 self.add_light_callback(*closest_vertex)
@@ -542,7 +1815,13 @@ class MainWindow(QMainWindow):
         self.lights = []
         self.draggable_lights = []#had to make a seperate list that stores the object itself
         self.light_counter = 1
+        self.new_lights = 0 # added but not yet drawn in the 2D view or listed in the selector
         self.play=True
+        self.reader = None # the fileReader playing into this window, if any
+        self.events = EventQueue() # filled by the file reader thread, applied here on the GUI thread
+        self.event_timer = QTimer(self)
+        self.event_timer.timeout.connect(self.apply_events)
+        self.event_timer.start(16) # once per frame at 60 Hz
 
         main_layout.addWidget(self.opengl_widget,0,0)
         self.opengl_widget.lights = self.lights
@@ -655,9 +1934,24 @@ class MainWindow(QMainWindow):
         controls_layout.addWidget(load_obj_btn,4,4)          
         
         
+        timeline_layout = QHBoxLayout()
+        self.time_label = QLabel("0.00 / 0.00")
+        self.timeline = QSlider(Qt.Orientation.Horizontal)
+        self.timeline.setRange(0, 1000)
+        self.timeline.valueChanged.connect(self.scrub)
+        timeline_layout.addWidget(QLabel("Timeline:"))
+        timeline_layout.addWidget(self.timeline)
+        timeline_layout.addWidget(self.time_label)
+        rate_selector = QComboBox()
+        rate_selector.addItems(["0.25x", "0.5x", "1x", "2x", "4x", "8x", "16x", "32x", "64x", "max"])
+        rate_selector.setCurrentText("1x")
+        rate_selector.currentTextChanged.connect(self.set_rate)
+        timeline_layout.addWidget(rate_selector)
+
         main_layout.addLayout(controls_layout,1,0)
         main_layout.addLayout(controls_layout2,0,1)
         main_layout.addLayout(controls_layout3,1,1)
+        main_layout.addLayout(timeline_layout,2,0,1,2)
         main_widget.setLayout(main_layout)
         self.setCentralWidget(main_widget)        
  
@@ -666,6 +1960,12 @@ class MainWindow(QMainWindow):
             self.play=False 
         else:
             self.play=True
+        if self.reader is not None:
+            self.reader.clock.resume() if self.play else self.reader.clock.pause()
+
+    def set_rate(self, text):
+        if self.reader is not None:
+            self.reader.clock.set_rate(math.inf if text == "max" else float(text.rstrip("x")))
 
     def load_new_object(self):
         select_window.new(self)   
@@ -701,17 +2001,25 @@ class MainWindow(QMainWindow):
     def update_2d_view(self, view_mode):
         self.viewer_2d.update_2d_view(self.opengl_widget.objs[0].vertices, self.lights, view_mode)
         
-    def add_light(self, x, y, z, color=(255, 255, 0)):
+    def add_light(self, x, y, z, color=(255, 255, 0), redraw=True):
         self.lights.append((x, y, z, color))
-        self.opengl_widget.update()
-        self.viewer_2d.update_2d_view(self.opengl_widget.objs[0].vertices, self.lights, self.viewer_2d.view_mode)
-        
-        self.light_selector.addItems([str(self.light_counter)])
-        self.light_counter +=1        
+        self.opengl_widget.lights_changed()
+        self.new_lights += 1
+        if redraw: # events leave it to the end of the batch, the 2D view is a full matplotlib redraw
+            self.show_new_lights()
+
+    def show_new_lights(self):
+        """Redraw the 2D view and list the lights added since the last call in the selector."""
+        if self.opengl_widget.objs:
+            self.viewer_2d.update_2d_view(self.opengl_widget.objs[0].vertices, self.lights, self.viewer_2d.view_mode)
+        self.light_selector.addItems([str(self.light_counter + n) for n in range(self.new_lights)])
+        self.light_counter += self.new_lights
+        self.new_lights = 0
     
     def wipe(self):
         self.lights=[]
         self.opengl_widget.lights=self.lights
+        self.opengl_widget.lights_changed()
 
     def place_light_from_coords(self):
         try:
@@ -722,79 +2030,681 @@ class MainWindow(QMainWindow):
         except ValueError:
             print("Invalid coordinates entered!")            
     
+    def apply_events(self):
+        """Apply everything queued since the last frame, collapsed to the latest state per object, then repaint once."""
+        profiler = self.opengl_widget.profiler
+        with profiler.section("events"): # counted in the next frame drawn
+            received = self.events.drain()
+            events = coalesce_events(received)
+            for event in events:
+                try:
+                    self.apply_event(event)
+                except Exception as e: # an exception in a timer slot aborts the whole viewer, drop the event instead
+                    print("could not apply", event, e)
+            if self.new_lights:
+                self.show_new_lights()
+        profiler.count("events_received", len(received))
+        profiler.count("events_applied", len(events))
+        if events or self.opengl_widget.motion: # moving objects need a frame every tick
+            self.opengl_widget.update()
+        if self.reader is not None and not self.timeline.isSliderDown():
+            duration = self.reader.log.duration()
+            now = min(self.reader.clock.now(), duration)
+            self.time_label.setText(f"{now:.2f} / {duration:.2f}  lag {1000 * self.reader.lag:.0f}ms")
+            self.timeline.blockSignals(True) # moving the handle to follow playback is not a seek
+            self.timeline.setValue(int(1000 * now / duration) if duration > 0 else 0)
+            self.timeline.blockSignals(False)
+
+    def scrub(self, value):
+        if self.reader is not None:
+            self.reader.seek(value / 1000 * self.reader.log.duration())
+
+    def apply_event(self, event):
+        """Apply one event. Indexes are checked like SceneState.apply does, socket producers can send anything."""
+        objects = len(self.opengl_widget.objs or [])
+        match event:
+            case ("CREATE", _, path, vals, mesh):
+                self.opengl_widget.add_secondary(path, vals, mesh)
+            case ("MODIFY", t, index, vals, next_t, next_vals) if 0 <= index < objects: # from a log, with the object's next sample
+                self.opengl_widget.edit_obj(index, vals)
+                self.opengl_widget.set_motion(index, t, vals, next_t, next_vals)
+            case ("MODIFY", _, index, vals) if 0 <= index < objects:
+                self.opengl_widget.edit_obj(index, vals)
+            case ("ADD_LIGHT", _, x, y, z, colour):
+                self.add_light(x, y, z, colour, redraw=False)
+            case ("MODIFY_LIGHT", _, index, colour) if 0 <= index < len(self.lights):
+                self.opengl_widget.change_light_colour(index, colour)
+            case ("SET_LABEL", _, index, flag) if 0 <= index < objects:
+                self.opengl_widget.set_label(index, flag)
+            case ("SET_CAMERA", _, type, angles, x, y, z):
+                self.opengl_widget.set_camera(type, angles, x, y, z)
+            case ("WIPE",):
+                self.opengl_widget.wipe()
+                self.wipe()
+            case ("PING", _, token, reply):
+                reply(token)
+            case _:
+                print("ignored event, no such object or light:", event)
+
     def closeEvent(self, event):
         os._exit(0)    
 
+def parse_event(line):
+    """One .log line as an event tuple (kind, time, ...), with indexes made 0-based. None for blank or unknown lines."""
+    attributes = line.strip().split(",")
+    if len(attributes) < 2:
+        return None
+    kind, t = attributes[0], float(attributes[1])
+    if kind == "CREATE" or kind == "MODIFY":
+        # syntax: [[x,y,z],color,[angle_x,angle_y,angle_z],transparency,name]
+        vals=[[float(attributes[3]),float(attributes[4]),float(attributes[5])],[int(attributes[6]),int(attributes[7]),int(attributes[8])],[float(attributes[9]),float(attributes[10]),float(attributes[11])],float(attributes[12]),attributes[13]]
+        return (kind, t, attributes[2] if kind == "CREATE" else int(attributes[2])-1, vals)
+    elif kind == "ADD_LIGHT":
+        return (kind, t, float(attributes[2]), float(attributes[3]), float(attributes[4]), (int(attributes[5]), int(attributes[6]), int(attributes[7])))
+    elif kind == "MODIFY_LIGHT":
+        return (kind, t, int(attributes[2])-1, (int(attributes[3]), int(attributes[4]), int(attributes[5])))
+    elif kind == "SET_LABEL":
+        return (kind, t, int(attributes[2])-1, int(attributes[3]))
+    elif kind == "SET_CAMERA": # type 1 is the free camera and carries a position, 2 orbits the first object
+        if int(attributes[2])==1:
+            return (kind, t, 0, [float(attributes[3]),float(attributes[4])], float(attributes[5]), float(attributes[6]), float(attributes[7]))
+        return (kind, t, 1, [float(attributes[3]),float(attributes[4])], None, None, None)
+    elif kind == "RESTART_FILE":
+        return (kind, t)
+    elif kind == "NEW_FILE":
+        return (kind, t, attributes[2])
+    return None
+
+
+class EventQueue:
+    """Hands parsed events from a producer thread to the GUI thread. deque append/popleft are atomic, so no lock."""
+    def __init__(self):
+        self.events = collections.deque()
+
+    def put(self, event):
+        self.events.append(event)
+
+    def __len__(self):
+        return len(self.events)
+
+    def drain(self):
+        events = []
+        try:
+            while True:
+                events.append(self.events.popleft())
+        except IndexError:
+            return events
+
+
+COALESCED_EVENT_KINDS = ("MODIFY", "MODIFY_LIGHT", "SET_LABEL", "SET_CAMERA") # later ones overwrite earlier ones
+
+
+def coalesce_events(events):
+    """Keep only the latest MODIFY / MODIFY_LIGHT / SET_LABEL per index and the latest SET_CAMERA.
+    CREATE, ADD_LIGHT and WIPE change what the indexes refer to, so pending updates are flushed before them."""
+    result, pending = [], {}
+    for event in events:
+        if event[0] in COALESCED_EVENT_KINDS:
+            key = (event[0],) if event[0] == "SET_CAMERA" else event[:1] + event[2:3]
+            pending[key] = event # a replaced key keeps its place, updates to different keys are independent
+        else:
+            result.extend(pending.values())
+            pending.clear()
+            result.append(event)
+    result.extend(pending.values())
+    return result
+
+
+LOG_EVENT_KINDS = ("CREATE", "MODIFY", "ADD_LIGHT", "MODIFY_LIGHT", "SET_LABEL", "SET_CAMERA", "RESTART_FILE", "NEW_FILE")
+LOG_VALUES = 10 # numeric payload columns, x y z r g b pitch yaw roll transparency for objects
+LOG_CACHE_VERSION = 3
+KEYFRAME_ROWS = 500 # rows between scene snapshots, bounds how many events a seek replays
+
+
+class SceneState:
+    """The scene a run of events leaves behind, without any Qt or GL, so the player can snapshot and restore it."""
+    def __init__(self):
+        self.objects = [] # [path, vals, label flag]
+        self.lights = [] # [x, y, z, colour]
+        self.camera = None # last SET_CAMERA event, wiping the scene leaves the camera alone
+
+    def apply(self, event):
+        match event:
+            case ("CREATE", _, path, vals, *_):
+                self.objects.append([path, vals, 1])
+            case ("MODIFY", _, index, vals, *_) if 0 <= index < len(self.objects):
+                self.objects[index][1] = vals
+            case ("ADD_LIGHT", _, x, y, z, colour):
+                self.lights.append([x, y, z, colour])
+            case ("MODIFY_LIGHT", _, index, colour) if 0 <= index < len(self.lights):
+                self.lights[index][3] = colour
+            case ("SET_LABEL", _, index, flag) if 0 <= index < len(self.objects):
+                self.objects[index][2] = flag
+            case ("SET_CAMERA", *_):
+                self.camera = event
+            case ("RESTART_FILE", *_) | ("WIPE",): # the scene is empty once a file restarts
+                self.objects, self.lights = [], []
+            # a NEW_FILE row leaves this file's scene alone, the player rebuilds it when the nested file finishes
+
+    def snapshot(self):
+        """Plain lists only, so snapshots can be stored in the log cache header."""
+        return json.loads(json.dumps({"objects": self.objects, "lights": self.lights, "camera": self.camera}))
+
+    @staticmethod
+    def events(snapshot):
+        """Events that rebuild a snapshot on an empty scene."""
+        events = []
+        for index, (path, vals, label) in enumerate(snapshot["objects"]):
+            events.append(("CREATE", 0.0, path, vals))
+            if label != 1:
+                events.append(("SET_LABEL", 0.0, index, label))
+        for x, y, z, colour in snapshot["lights"]:
+            events.append(("ADD_LIGHT", 0.0, x, y, z, tuple(colour)))
+        if snapshot["camera"] is not None:
+            events.append(tuple(snapshot["camera"]))
+        return events
+
+def compile_log(data):
+    """Columns for every event in .log contents (bytes): kind, time, index, numeric values and interned strings.
+    Also a time index, the running maximum of the timestamps, which stays sorted for logs that step back a little."""
+    kinds, times, indexes, values, names, paths = [], [], [], [], [], []
+    scene, keyframes = SceneState(), [] # (row, snapshot of the scene before that row)
+    strings = {}
+    def intern(text):
+        return strings.setdefault(text, len(strings))
+    for line in data.decode().splitlines():
+        try:
+            event = parse_event(line)
+        except (ValueError, IndexError):
+            print("skipping bad line:", line.strip())
+            continue
+        if event is None:
+            continue
+        if kinds and len(kinds) % KEYFRAME_ROWS == 0:
+            keyframes.append((len(kinds), scene.snapshot()))
+        scene.apply(event)
+        row, index, name, path = [math.nan] * LOG_VALUES, -1, -1, -1
+        match event:
+            case ("CREATE" | "MODIFY", _, target, vals):
+                row = vals[0] + vals[1] + vals[2] + [vals[3]]
+                name = intern(vals[4])
+                if event[0] == "CREATE":
+                    path = intern(target)
+                else:
+                    index = target
+            case ("ADD_LIGHT", _, x, y, z, colour):
+                row[:6] = [x, y, z, *colour]
+            case ("MODIFY_LIGHT", _, index, colour):
+                row[:3] = colour
+            case ("SET_LABEL", _, index, flag):
+                row[0] = flag
+            case ("SET_CAMERA", _, index, angles, x, y, z):
+                row[:5] = [a if a is not None else math.nan for a in angles + [x, y, z]]
+            case ("NEW_FILE", _, target):
+                path = intern(target)
+        kinds.append(LOG_EVENT_KINDS.index(event[0]))
+        times.append(event[1])
+        indexes.append(index)
+        values.append(row)
+        names.append(name)
+        paths.append(path)
+    times = np.array(times, dtype=np.float64)
+    arrays = {"kind": np.array(kinds, dtype=np.uint8), "time": times, "index": np.array(indexes, dtype=np.int32),
+              "values": np.array(values, dtype=np.float32).reshape(-1, LOG_VALUES),
+              "name": np.array(names, dtype=np.int32), "path": np.array(paths, dtype=np.int32),
+              "time_index": np.maximum.accumulate(times) if len(times) else times}
+    return arrays, list(strings), keyframes
+
+
+class LogFile:
+    """A .log compiled to columns and memory-mapped from <file>.log.cache, so playback can start at any row."""
+    def __init__(self, path):
+        self.path = path
+        cache = path + ".cache"
+        stat = os.stat(path)
+        try:
+            header, arrays = read_array_file(cache)
+            if not sidecar_matches(header, path, stat, LOG_CACHE_VERSION, cache):
+                raise ValueError("stale")
+        except (OSError, ValueError, KeyError):
+            with open(path, "rb") as file:
+                data = file.read()
+            arrays, strings, keyframes = compile_log(data)
+            header = {"version": LOG_CACHE_VERSION, "size": stat.st_size, "mtime": stat.st_mtime_ns,
+                      "hash": hashlib.blake2b(data).hexdigest(), "strings": strings, "keyframes": keyframes}
+            try:
+                write_array_file(cache, header, arrays)
+            except OSError as e:
+                print("could not write log cache", cache, e)
+        self.strings = header["strings"]
+        self.keyframes = header["keyframes"]
+        self.keyframe_rows = [row for row, snapshot in self.keyframes]
+        self.kind = arrays["kind"]
+        self.time = arrays["time"]
+        self.index = arrays["index"]
+        self.values = arrays["values"]
+        self.name = arrays["name"]
+        self.path_id = arrays["path"]
+        self.time_index = arrays["time_index"]
+        self.next_modify = self.link_modifies()
+
+    def link_modifies(self):
+        """Row of the next MODIFY of the same object for each MODIFY row, -1 if there is none before the
+        scene is wiped by a RESTART_FILE or NEW_FILE."""
+        kind = np.asarray(self.kind)
+        rows = np.flatnonzero(kind == LOG_EVENT_KINDS.index("MODIFY"))
+        scene = np.cumsum((kind == LOG_EVENT_KINDS.index("RESTART_FILE")) | (kind == LOG_EVENT_KINDS.index("NEW_FILE")))
+        keys = scene[rows] * (int(np.max(self.index, initial=0)) + 1) + np.asarray(self.index)[rows]
+        order = np.lexsort((rows, keys)) # by object, then by row
+        next_modify = np.full(len(kind), -1, dtype=np.int64)
+        same = keys[order[:-1]] == keys[order[1:]]
+        next_modify[rows[order[:-1]][same]] = rows[order[1:]][same]
+        return next_modify
+
+    def __len__(self):
+        return len(self.kind)
+
+    def duration(self):
+        return float(self.time_index[-1]) if len(self) else 0.0
+
+    def seek(self, t):
+        """First row due at or after t, O(log n)."""
+        return int(np.searchsorted(self.time_index, t, side="left"))
+
+    def keyframe(self, row):
+        """Latest (row, snapshot) at or before a row, None if the nearest earlier state is the start of the file."""
+        i = bisect.bisect_right(self.keyframe_rows, row) - 1
+        return self.keyframes[i] if i >= 0 else None
+
+    def event(self, row):
+        """The same tuple parse_event gives for the line this row came from."""
+        kind = LOG_EVENT_KINDS[self.kind[row]]
+        t, index, v = float(self.time[row]), int(self.index[row]), self.values[row].tolist()
+        if kind == "CREATE" or kind == "MODIFY":
+            vals = [v[0:3], [int(c) for c in v[3:6]], v[6:9], v[9], self.strings[self.name[row]]]
+            return (kind, t, self.strings[self.path_id[row]] if kind == "CREATE" else index, vals)
+        elif kind == "ADD_LIGHT":
+            return (kind, t, v[0], v[1], v[2], (int(v[3]), int(v[4]), int(v[5])))
+        elif kind == "MODIFY_LIGHT":
+            return (kind, t, index, (int(v[0]), int(v[1]), int(v[2])))
+        elif kind == "SET_LABEL":
+            return (kind, t, index, int(v[0]))
+        elif kind == "SET_CAMERA":
+            x, y, z = [None if math.isnan(c) else c for c in v[2:5]]
+            return (kind, t, index, v[0:2], x, y, z)
+        elif kind == "NEW_FILE":
+            return (kind, t, self.strings[self.path_id[row]])
+        return (kind, t)
+
+    def playback_event(self, row):
+        """event(row), with a MODIFY followed by the time and values of the object's next MODIFY to move towards."""
+        event = self.event(row)
+        following = self.next_modify[row]
+        if following >= 0:
+            after = self.event(following)
+            event = event + (after[1], after[3])
+        return event
+
+
+class LogTail:
+    """Follows a .log that is still being written, like tail -f. Polls os.stat, which is cheap and works
+    everywhere, instead of depending on inotify."""
+    poll_interval = 0.02 # seconds between stats when nothing new was written, bounds the added latency
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0 # bytes of the file consumed so far
+        self.partial = b"" # bytes after the last newline, the writer has not finished that line yet
+        self.identity = None # (st_dev, st_ino), a new file in its place counts as a truncation
+        self.last_time = 0.0
+
+    def poll(self):
+        """(events from lines completed since the last call, whether the file was truncated or replaced)"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError: # not created yet, or being replaced
+            return [], False
+        truncated = False
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self.identity or stat.st_size < self.offset:
+            truncated = self.identity is not None
+            self.identity, self.offset, self.partial = identity, 0, b""
+        if stat.st_size == self.offset:
+            return [], truncated
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            data = file.read(stat.st_size - self.offset)
+        self.offset += len(data)
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        events = []
+        for line in lines:
+            try:
+                event = parse_event(line.decode(errors="replace"))
+            except (ValueError, IndexError):
+                print("skipping bad line:", line.strip())
+                continue
+            if event is not None:
+                events.append(event)
+                self.last_time = max(self.last_time, event[1])
+        return events, truncated
+
+    def duration(self):
+        return self.last_time
+
+
+class PlaybackClock:
+    """Log time measured against time.perf_counter, so the reader waits for absolute deadlines and
+    parse and dispatch cost can not add up into drift. A rate of math.inf plays as fast as possible."""
+    MIN_RATE, MAX_RATE = 0.25, 64.0
+
+    def __init__(self, rate=1.0, paused=False):
+        self.changed = threading.Condition() # notified on every seek, pause, resume or rate change
+        self.rate = self.clamp(rate)
+        self.paused = paused
+        self.origin = 0.0 # log time at self.started
+        self.started = time.perf_counter()
+
+    @classmethod
+    def clamp(cls, rate):
+        return rate if math.isinf(rate) else min(max(rate, cls.MIN_RATE), cls.MAX_RATE)
+
+    def now(self):
+        if self.paused or math.isinf(self.rate):
+            return self.origin
+        return self.origin + (time.perf_counter() - self.started) * self.rate
+
+    def rebase(self, t):
+        self.origin, self.started = t, time.perf_counter()
+
+    def set(self, t):
+        with self.changed:
+            self.rebase(t)
+            self.changed.notify_all()
+
+    def set_rate(self, rate):
+        with self.changed:
+            self.rebase(self.now())
+            self.rate = self.clamp(rate)
+            self.changed.notify_all()
+
+    def pause(self):
+        with self.changed:
+            self.rebase(self.now())
+            self.paused = True
+            self.changed.notify_all()
+
+    def resume(self):
+        with self.changed:
+            self.rebase(self.now())
+            self.paused = False
+            self.changed.notify_all()
+
+    def wait_until(self, t, interrupted):
+        """Block until log time t, False if interrupted() (checked under self.changed) became true first."""
+        with self.changed:
+            while not interrupted():
+                if self.paused:
+                    self.changed.wait()
+                elif math.isinf(self.rate):
+                    self.origin = max(self.origin, t) # fast forward, the clock is wherever the log is
+                    return True
+                else:
+                    remaining = (t - self.now()) / self.rate
+                    if remaining <= 0:
+                        return True
+                    self.changed.wait(remaining)
+            return False
+
+    def lag(self, t):
+        """Wall clock seconds dispatch is behind the deadline for log time t."""
+        if math.isinf(self.rate):
+            return 0.0
+        return max(0.0, (self.now() - t) / self.rate)
+
+
 class fileReader():
-    def __init__(self,filename,ref,select_window):
-        self.file = open(filename, "r")
+    def __init__(self,filename,ref,select_window,rate=1.0,follow=False,headless=False):
+        self.follow = follow # play lines as they are appended instead of a finished file
+        self.log = LogTail(filename) if follow else LogFile(filename)
         self.select_window = select_window
         self.ref=ref
-        self.newfile=""
-        self.oldfiles=[]
+        self.oldfiles=[] # (log, row, time) to go back to when a NEW_FILE finishes
+        self.row = 0 # next row of self.log to play
+        self.time = 0.0 # time of the last event played
+        self.clock = PlaybackClock(rate, paused=True) # from 0 once the window and first mesh are loaded, headless only in step()
+        self.pending_seek = None # set under self.clock.changed, interrupts the wait for the next event
+        self.lag = self.max_lag = 0.0 # seconds the last / worst event was dispatched behind schedule
         
-        line =self.file.readline()
-        attributes = line.strip().split(",")
-        self.time = 0.0
-        
-        if attributes[0] == "CREATE":
-            vals=[[int(attributes[3]),int(attributes[4]),int(attributes[5])],[int(attributes[6]),int(attributes[7]),int(attributes[8])],[int(attributes[9]),int(attributes[10]),int(attributes[11])],float(attributes[12]),attributes[13]]
-            # syntax: [[x,y,z],color,[angle_x,angle_y],transparency,name]
-            self.ref = MainWindow(attributes[2],vals)
+        if follow:
+            self.backlog = []
+            while not self.backlog: # the window needs the first CREATE, wait for the writer to get that far
+                self.backlog = self.log.poll()[0]
+                time.sleep(LogTail.poll_interval)
+            first = self.backlog.pop(0)
+        else:
+            first = self.log.event(0) if len(self.log) else None
+        if first is not None and first[0] == "CREATE":
+            self.ref = MainWindow(first[2],first[3])
+            self.ref.reader = self
+            self.ref.opengl_widget.time_source = self.clock.now
             self.ref.resize(900, 650)   
-            self.ref.show()
+            if not headless:
+                self.ref.show()
+            self.row = 1 # the window already holds the first object
+            if follow:
+                self.ref.timeline.setEnabled(False) # nothing to seek in, the end of the file keeps moving
         else:
             print("read file corrupt, does not start with create")
         
-        result = threading.Thread(target=lambda: self.read()).start()
-
+        if headless: # driven by step() instead
+            return
+        self.clock.resume()
+        result = threading.Thread(target=lambda: self.tail() if follow else self.read(), daemon=True).start() # idles once finished, so it must not keep the app open
 
-    def read(self,index=0):
-        event=threading.Event()
-        self.file.seek(index)
-        for index,line in enumerate(self.file):
-            while not self.ref.play:
-                time.sleep(0.5)
-            attributes = line.strip().split(",")
-            
-            event.wait(float(attributes[1])-self.time-0.01)
-            self.time=float(attributes[1])
-            if attributes[0] == "CREATE":
-                # syntax: [[x,y,z],color,[angle_x,angle_y,angle_z],transparency,name]
-                vals=[[float(attributes[3]),float(attributes[4]),float(attributes[5])],[int(attributes[6]),int(attributes[7]),int(attributes[8])],[int(attributes[9]),int(attributes[10]),int(attributes[11])],float(attributes[12]),attributes[13]]
-                self.ref.opengl_widget.add_secondary(attributes[2],vals)
-            elif attributes[0] == "MODIFY":
-                vals=[[float(attributes[3]),float(attributes[4]),float(attributes[5])],[int(attributes[6]),int(attributes[7]),int(attributes[8])],[int(attributes[9]),int(attributes[10]),int(attributes[11])],float(attributes[12]),attributes[13]]
-                threading.Thread(target=lambda: self.ref.opengl_widget.edit_obj(int(attributes[2])-1,vals)).start()    
-            elif attributes[0] == "ADD_LIGHT":
-                self.ref.add_light(float(attributes[2]),float(attributes[3]),float(attributes[4]),(int(attributes[5]),int(attributes[6]),int(attributes[7])))
-            elif attributes[0] == "MODIFY_LIGHT":
-                threading.Thread(target=lambda: self.ref.opengl_widget.change_light_colour(int(attributes[2])-1,(int(attributes[3]),int(attributes[4]),int(attributes[5])))).start()
-            elif attributes[0] == "SET_LABEL":
-                self.ref.opengl_widget.set_label(int(attributes[2])-1,int(attributes[3]))
-            elif attributes[0] == "SET_CAMERA":
-                if int(attributes[2])==1:
-                    self.ref.opengl_widget.set_camera(int(attributes[2])-1,[float(attributes[3]),float(attributes[4])],float(attributes[5]),float(attributes[6]),float(attributes[7]))
+    def wipe(self):
+        self.ref.events.put(("WIPE",))
+
+    def queue(self, event):
+        if event[0] == "CREATE": # parse the mesh here rather than on the GUI thread
+            event = event + (self.ref.opengl_widget.meshes.acquire(event[2]),)
+        self.ref.events.put(event)
+
+    def seek(self, t):
+        """Jump playback of the current file to time t, can be called from any thread."""
+        with self.clock.changed:
+            self.pending_seek = t
+            self.clock.changed.notify_all()
+
+    def jump(self, t):
+        """Rebuild the scene as it is at time t from the nearest earlier keyframe plus the rows between it and t,
+        without waiting, then carry on from there."""
+        row = self.log.seek(t)
+        self.rebuild(row)
+        self.row, self.time = row, t
+        self.clock.set(t)
+
+    def rebuild(self, row):
+        """Wipe and queue the scene of self.log as it is just before a row."""
+        self.wipe()
+        start = 0
+        keyframe = self.log.keyframe(row)
+        if keyframe is not None:
+            start, snapshot = keyframe
+            for event in SceneState.events(snapshot):
+                self.queue(event)
+        for i in range(start, row):
+            event = self.log.playback_event(i)
+            if event[0] != "RESTART_FILE" and event[0] != "NEW_FILE":
+                self.queue(event)
+
+    def tail(self):
+        """Play events as soon as the writer finishes their line. Pausing stops polling, the file keeps the rest."""
+        events = self.backlog
+        while True:
+            self.clock.wait_until(-math.inf, lambda: False) # returns at once unless paused
+            for event in events:
+                self.time = event[1]
+                if event[0] == "RESTART_FILE":
+                    self.wipe()
+                elif event[0] == "NEW_FILE": # follow the new file from its start instead
+                    self.log = LogTail(event[2])
+                    self.wipe()
+                    break
                 else:
-                    self.ref.opengl_widget.set_camera(int(attributes[2])-1,[float(attributes[3]),float(attributes[4])])
-            elif attributes[0] == "RESTART_FILE":
-                self.newfile=self.file
-                self.ref.opengl_widget.wipe()
-                self.ref.wipe()
-                self.file.seek(0)
-                self.read()
-            elif attributes[0] == "NEW_FILE":
-                self.oldfiles.append([self.file,index,self.time])
-                self.file=open(attributes[2], "r")
-                self.ref.opengl_widget.wipe()
-                self.ref.wipe()
-                self.read()
-        if(self.oldfiles != []):
-            self.file,index,self.time=self.oldfiles.pop(-1)
-            self.ref.opengl_widget.wipe()
-            self.ref.wipe()
-            self.file.read(index)
+                    self.queue(event)
+            self.clock.set(self.time)
+            events, truncated = self.log.poll()
+            if truncated: # the writer started over
+                self.wipe()
+            if not events:
+                time.sleep(LogTail.poll_interval)
+
+    def dispatch(self, event):
+        """Play the event at self.row and move past it, following RESTART_FILE and NEW_FILE."""
+        self.row += 1
+        self.time=event[1]
+        if event[0] == "RESTART_FILE":
+            self.wipe()
+            self.row, self.time = 0, 0.0
+            self.clock.set(0.0)
+        elif event[0] == "NEW_FILE":
+            self.oldfiles.append((self.log, self.row, self.time))
+            self.log = LogFile(event[2])
+            self.row, self.time = 0, 0.0
+            self.clock.set(0.0)
+            self.wipe()
+        else:
+            self.queue(event)
+
+    def finish_file(self):
+        """At the end of self.log go back to the file that opened it and put back its scene, False if there is none."""
+        if not self.oldfiles:
+            return False
+        self.log, self.row, self.time = self.oldfiles.pop()
+        self.rebuild(self.row - 1) # the saved row is the one after NEW_FILE, which the nested file wiped
+        self.clock.set(self.time)
+        return True
+
+    def step(self, dt):
+        """Play the next dt seconds of log time at once, for rendering at fixed timesteps. False once finished."""
+        target = self.clock.now() + dt
+        while True:
+            if self.row >= len(self.log):
+                end = self.time
+                if not self.finish_file():
+                    self.clock.set(target)
+                    return False
+                target = self.time + target - end # the rest of the step carries on in the outer file
+                continue
+            deadline = float(self.log.time_index[self.row])
+            if deadline > target:
+                break
+            event = self.log.playback_event(self.row)
+            self.dispatch(event)
+            if event[0] == "RESTART_FILE" or event[0] == "NEW_FILE": # time starts again from 0
+                target -= deadline
+        self.clock.set(target)
+        return True
+
+    def read(self):
+        while True:
+            while self.row < len(self.log):
+                deadline = float(self.log.time_index[self.row]) # running max, an out of order line plays straight away
+                if not self.clock.wait_until(deadline, lambda: self.pending_seek is not None):
+                    with self.clock.changed:
+                        t, self.pending_seek = self.pending_seek, None
+                    self.jump(t)
+                    continue
+                self.lag = self.clock.lag(deadline)
+                self.max_lag = max(self.max_lag, self.lag)
+                self.dispatch(self.log.playback_event(self.row))
+            if self.finish_file():
+                continue
+            with self.clock.changed: # finished, the timeline can still seek back into the file
+                while self.pending_seek is None:
+                    self.clock.changed.wait()
+                t, self.pending_seek = self.pending_seek, None
+            self.jump(t)
+
+
+class TelemetryServer:
+    """Takes .log lines over a local socket, "host:port" for TCP or a path for a Unix domain socket, from any
+    number of producers at once. Runs an asyncio loop in its own thread and decodes whatever each read returned
+    as one batch. A producer may also send PING,<token>, answered with PONG,<token> once the GUI applied it."""
+    high_water = 10000 # queued events above which producers stop being read, so their socket buffers fill up
+    read_size = 65536
+
+    def __init__(self, address):
+        self.address = address
+        self.window = None # MainWindow the events go to, attached once the first CREATE has built it
+        self.first = None
+        self.ready = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.listen(), self.loop).result() # bind errors are raised here
+
+    async def listen(self):
+        host, sep, port = self.address.rpartition(":")
+        if sep and port.isdigit():
+            self.server = await asyncio.start_server(self.handle, host or "127.0.0.1", int(port))
+        else:
+            self.server = await asyncio.start_unix_server(self.handle, self.address)
 
+    def wait_first(self):
+        """Block until a producer sends the first CREATE, the window is built from it."""
+        self.ready.wait()
+        return self.first
+
+    def attach(self, window):
+        self.window = window
+
+    async def handle(self, reader, writer):
+        partial = b"" # bytes after the last newline
+        try:
+            while data := await reader.read(self.read_size):
+                lines = (partial + data).split(b"\n")
+                partial = lines.pop()
+                for event in self.decode(lines, writer):
+                    await self.put(event)
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def decode(self, lines, writer):
+        events = []
+        for line in lines:
+            text = line.decode(errors="replace").strip()
+            if text.startswith("PING,"):
+                reply = lambda token: self.loop.call_soon_threadsafe(writer.write, f"PONG,{token}\n".encode())
+                events.append(("PING", time.perf_counter(), text[5:], reply))
+                continue
+            try:
+                event = parse_event(text)
+            except (ValueError, IndexError):
+                print("skipping bad line:", text)
+                continue
+            if event is not None:
+                events.append(event)
+        return events
+
+    async def put(self, event):
+        if self.first is None and event[0] == "CREATE":
+            self.first = event
+            self.ready.set()
+            return
+        while self.window is None: # nowhere to put events until the GUI thread has built the window
+            await asyncio.sleep(0.01)
+        if event[0] == "RESTART_FILE": # a stream has no file to go back to, only the scene to clear
+            event = ("WIPE",)
+        elif event[0] == "NEW_FILE":
+            print("NEW_FILE is not supported over a socket, play", event[2], "from a file instead")
+            return
+        if event[0] == "CREATE": # parse the mesh off both the GUI thread and this loop
+            event = event + (await self.loop.run_in_executor(None, self.window.opengl_widget.meshes.acquire, event[2]),)
+        while len(self.window.events) > self.high_water:
+            await asyncio.sleep(0.005)
+        self.window.events.put(event)
 
 
 class attributeSelect(QMainWindow): 
@@ -870,16 +2780,128 @@ class attributeSelect(QMainWindow):
                 self.parent.opengl_widget.edit_obj(int(self.path.text())-1,attributes)       
                 self.hide()
 
-if __name__ == "__main__":
+def headless_context():
+    """Make a GL context current without a display, through EGL (Mesa's llvmpipe on a build server). Rendering
+    goes to a framebuffer object, so the pbuffer is only there for drivers that need some surface."""
+    from OpenGL import EGL
+    display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    if not EGL.eglInitialize(display, None, None):
+        raise RuntimeError("no EGL display, is Mesa installed?")
+    attributes = (EGL.EGLint * 13)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8,
+                                   EGL.EGL_BLUE_SIZE, 8, EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                                   EGL.EGL_NONE)
+    config, count = EGL.EGLConfig(), EGL.EGLint()
+    if not EGL.eglChooseConfig(display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count)) or count.value == 0:
+        raise RuntimeError("no EGL config with desktop OpenGL")
+    surface = EGL.eglCreatePbufferSurface(display, config, (EGL.EGLint * 5)(EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+    if not EGL.eglMakeCurrent(display, surface, surface, context):
+        raise RuntimeError("could not make the EGL context current")
+    return display, surface, context
+
+
+class Framebuffer:
+    """Colour and depth renderbuffers to draw frames into offscreen."""
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.fbo = glGenFramebuffers(1)
+        self.colour, self.depth = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.colour)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.colour)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("framebuffer incomplete")
+
+    def read(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        return glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+
+
+def save_frame(pixels, width, height, path):
+    """Runs on the writer pool, GL rows go bottom up."""
+    image = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 3)[::-1]
+    Image.fromarray(image).save(path)
+
+
+def render_log(filename, out_dir, fps=30.0, size=(1280, 720), duration=None, workers=4, profile=None):
+    """Play a .log at fixed timesteps of 1/fps, unrelated to wall clock time, and write every frame as a PNG.
+    Logs that loop (RESTART_FILE at the end) need a duration. profile is a .csv or .json path for frame timings."""
+    context = headless_context()
+    os.makedirs(out_dir, exist_ok=True)
+    width, height = size
+    reader = fileReader(filename, None, None, headless=True)
+    window = reader.ref
+    if window is None:
+        return 0
+    widget = window.opengl_widget
+    widget.resize(width, height) # never shown, so no layout changes it
+    framebuffer = Framebuffer(width, height)
+    widget.initializeGL()
+    widget.resizeGL(width, height)
+    writers = concurrent.futures.ThreadPoolExecutor(workers)
+    pending = collections.deque()
+    frame, playing = 0, True
+    started = time.perf_counter()
+    while playing and (duration is None or frame / fps <= duration):
+        if frame > 0:
+            playing = reader.step(1 / fps)
+        window.apply_events()
+        glBindFramebuffer(GL_FRAMEBUFFER, framebuffer.fbo)
+        widget.paintGL()
+        pending.append(writers.submit(save_frame, framebuffer.read(), width, height,
+                                      os.path.join(out_dir, f"frame_{frame:05d}.png")))
+        while len(pending) > 2 * workers: # bound the frames held in memory if encoding falls behind
+            pending.popleft().result()
+        frame += 1
+    for future in pending:
+        future.result()
+    writers.shutdown()
+    if profile is not None:
+        widget.profiler.export_csv(profile) if profile.endswith(".csv") else widget.profiler.export_json(profile)
+    print(f"wrote {frame} frames to {out_dir} in {time.perf_counter() - started:.1f}s")
+    return frame
+
+
+if __name__ == "__main__" and "--render" in sys.argv:
+    import argparse
+    parser = argparse.ArgumentParser(description="render a .log to PNG frames without a display")
+    parser.add_argument("--render", metavar="LOG", required=True)
+    parser.add_argument("--out", default="frames", help="directory for frame_00000.png ...")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--size", default="1280x720", help="WIDTHxHEIGHT")
+    parser.add_argument("--duration", type=float, default=None, help="seconds of log to render, needed for looping logs")
+    parser.add_argument("--workers", type=int, default=4, help="threads encoding PNGs")
+    parser.add_argument("--profile", default=None, help=".csv or .json file for the timings of the last 600 frames")
+    args = parser.parse_args()
+    app = QApplication(sys.argv)
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    render_log(args.render, args.out, args.fps, (width, height), args.duration, args.workers, args.profile)
+    os._exit(0) # nothing to clean up, skip tearing down Qt and the GL context
+elif __name__ == "__main__":
     app = QApplication(sys.argv)
-    print("1 for file reader 2 for manual input")
+    print("1 for file reader 2 for manual input 3 to follow a log that is still being written 4 to listen on a socket")
     entry = int(input())    
     select_window = attributeSelect("main")    
-    if entry ==1:
+    if entry ==1 or entry ==3:
         print("enter file name")
         inpu = input() 
         main_window = None 
-        reader = fileReader(inpu,main_window,select_window)
+        reader = fileReader(inpu,main_window,select_window,follow=entry==3)
+    elif entry ==4:
+        print("enter host:port or a unix socket path (blank for 127.0.0.1:4907)")
+        server = TelemetryServer(input().strip() or "127.0.0.1:4907")
+        first = server.wait_first()
+        main_window = MainWindow(first[2],first[3])
+        main_window.timeline.setEnabled(False)
+        server.attach(main_window)
+        main_window.resize(900, 650)
+        main_window.show()
     else:
         select_window.show()    
     sys.exit(app.exec())